@@ -4,18 +4,43 @@
 
 from fastapi import FastAPI, Form, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import gzip
+import hashlib
+import hmac
+import io
+import json
 import os
 import csv
-import sqlite3
 import re
 import shutil
-from contextlib import contextmanager
+import tempfile
+import time
 from datetime import datetime, timezone, timedelta
-from fastapi import Body
+from fastapi import Body, Query
 from fastapi import Response
 from pathlib import Path
+from typing import Optional
+
+from broadcast import Hub, format_sse
+from change_feed import ChangeFeed
+from checkin_log import CheckinLog
+from checkin_tokens import assign_missing_tokens, find_guest, is_token, new_token
+import metrics
+from db import (
+    DATA_DIR, DatabaseBusy, close_pool, connect, get_conn, has_checkins_fts, init_db, lanes, offload, retry_busy, run_db,
+)
+from guest_import import MODES as IMPORT_MODES, apply_import, parse_guest_csv, plan_import
+from guest_store import GuestStore, read_guest_version
+from kiosk_sync import parse_offline_checkins, prune_changes, read_changes, read_snapshot
+from metrics import CHECKINS, Gauge, MetricsMiddleware, timed
+from name_index import best_match, is_short_query
+from profiler import SamplingProfiler
+from seat_map import SeatMap
+from snapshot import CsvSnapshotter, write_atomic
+from static_assets import AssetStore
+from stats import AttendanceStats
 
 # ----- Timezone: Thailand (+07:00)
 TH_TZ = timezone(timedelta(hours=7))
@@ -24,26 +49,22 @@ TH_TZ = timezone(timedelta(hours=7))
 # Environment
 # -----------------------------
 ADMIN_KEY = os.getenv("ADMIN_KEY")  # ตั้งค่าใน Render/เครื่องคุณ เช่น tpbadmin2025
+METRICS_KEY = os.getenv("METRICS_KEY")  # ถ้าตั้งไว้ /metrics ต้องส่ง Authorization: Bearer <key>
+KIOSK_KEY = os.getenv("KIOSK_KEY")  # key ของเครื่อง kiosk (X-Kiosk-Key) แยกจาก admin
 BASE_DIR = Path(__file__).resolve().parent
 
-# Directory for runtime data.  By default use "/data" so information
-# survives redeploys on platforms that provide a persistent volume at
-# that location.  If CHECKIN_DATA_DIR is set it will override this.
-DATA_DIR = Path(os.getenv("CHECKIN_DATA_DIR", "/data"))
-if not DATA_DIR.is_absolute():
-    DATA_DIR = BASE_DIR / DATA_DIR
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-
-DB_PATH = Path(os.getenv("CHECKIN_DB", DATA_DIR / "checkin.db"))
-DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+# DATA_DIR / DB path มาจาก db.py (CHECKIN_DATA_DIR, CHECKIN_DB) ที่เดียว
 
 # guests.csv path (เก็บรายชื่อปัจจุบัน)
 GUEST_CSV_PATH = Path(os.getenv("GUESTS_CSV", DATA_DIR / "guests.csv"))
 
 # ถ้ายังไม่มีไฟล์ guests.csv ใน DATA_DIR ให้ copy จากไฟล์ default ที่อยู่ใน repo
 DEFAULT_GUEST_CSV = BASE_DIR / "guests.csv"
+# (copy ลงไฟล์ชั่วคราวแล้ว rename: หลาย worker start พร้อมกันจะไม่เห็นไฟล์ครึ่ง ๆ)
 if not GUEST_CSV_PATH.exists() and DEFAULT_GUEST_CSV.exists():
-    shutil.copy(DEFAULT_GUEST_CSV, GUEST_CSV_PATH)
+    _tmp = GUEST_CSV_PATH.with_name(f".{GUEST_CSV_PATH.name}.{os.getpid()}.tmp")
+    shutil.copy(DEFAULT_GUEST_CSV, _tmp)
+    os.replace(_tmp, GUEST_CSV_PATH)
 
 # -----------------------------
 # FastAPI app & CORS
@@ -55,135 +76,136 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # -----------------------------
-# SQLite helpers
+# Guest cache
 # -----------------------------
-def dict_factory(cursor, row):
-    return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+# รายชื่อแขกในหน่วยความจำ (โหลดตอน startup, admin endpoints อัปเดตต่อ)
+guest_store = GuestStore(connect, GUEST_CSV_PATH)
 
-@contextmanager
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = dict_factory
-    try:
-        yield conn
-    finally:
-        conn.close()
+# log การเช็คอิน (direct หรือ write-behind ตาม CHECKIN_WRITE_BEHIND)
+checkin_log = CheckinLog(get_conn, dead_letter=DATA_DIR / "checkin_deadletter.jsonl")
 
-def init_db():
+# live feed ของ dashboard: แถว log ที่ commit แล้ว + การแก้ไขรายชื่อ
+hub = Hub()
+stats = AttendanceStats(get_conn)
 
-    with get_conn() as conn:
-        # tables เดิมของคุณ…
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS checkins (
-                id         INTEGER PRIMARY KEY AUTOINCREMENT,
-                name       TEXT,
-                seat       TEXT,
-                seat_en    TEXT,
-                user_agent TEXT,
-                ip         TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS guests (
-                name_key TEXT PRIMARY KEY,
-                seat     TEXT,
-                seat_en  TEXT
-            )
-        """)
-        conn.commit()
+# การเขียนจากทุก worker (uvicorn --workers N) มาทาง change feed ที่ตาม data_version
+# ของไฟล์ DB: แถว checkins ใหม่ -> live feed + ตัวนับ, รายชื่อถูกแก้จากที่อื่น -> โหลดใหม่
+feed = ChangeFeed(connect)
+feed.on_checkins.append(lambda rows: [hub.publish("checkin", r) for r in rows])
+feed.on_checkins.append(stats.apply_checkins)
+checkin_log.on_commit = feed.wake
 
-        # --- เพิ่มคอลัมน์ display_name ถ้ายังไม่มี ---
-        cols = conn.execute("PRAGMA table_info(guests)").fetchall()
-        has_display = any(c["name"] == "display_name" for c in cols)
-        if not has_display:
-            conn.execute("ALTER TABLE guests ADD COLUMN display_name TEXT")
-            conn.commit()
-
-
-        # ถ้าตาราง guests ยังว่าง ให้ import จาก CSV
-        count = conn.execute("SELECT COUNT(*) AS c FROM guests").fetchone()["c"]
-        if count == 0:
-            try:
-                with open(GUEST_CSV_PATH, encoding="utf-8") as f:
-                    reader = csv.DictReader(f)
-                    rows = []
-                    for r in reader:
-                        k = (r.get("name") or "").strip().lower()
-                        seat = (r.get("seat") or "").strip()
-                        seat_en = (r.get("seat_en") or "").strip()
-                        if k:
-                            rows.append((k, seat, seat_en))
-                    if rows:
-                        conn.executemany(
-                            "INSERT OR IGNORE INTO guests(name_key, seat, seat_en) VALUES (?,?,?)",
-                            rows
-                        )
-                        conn.commit()
-            except FileNotFoundError:
-                pass
+def on_guest_version(version):
+    # handler ใน process นี้จด version ไว้ก่อน commit (commit_guest_change) แล้วอัปเดต stats เอง
+    # version ที่ไม่ได้จดแปลว่า worker อื่น (หรือ sqlite3 CLI) แก้รายชื่อ
+    if not stats.is_known(version):
+        stats.load()
+        hub.publish("reset", {})
 
+feed.on_guest_version.append(on_guest_version)
+
+def commit_guest_change(conn, since=None):
+    """
+    Commit a guests write made by this process; returns the new guest_meta.version.
+
+    จด version (ตั้งแต่ since+1 ถ้าแก้หลายแถว) ไว้ก่อน commit: change feed / guest_store ที่เห็น
+    commit ก่อน handler เรียก stats.guest_*() / apply_change() จะได้ไม่โหลดใหม่ทั้งหมด (หรือส่ง reset)
+    เหมือนเป็นการแก้จาก worker อื่น
+    ตัด change log ของ kiosk ไปในตัว (trigger จดทุกครั้งที่แก้ ไม่ตัดก็โตไม่หยุด)
+    """
+    prune_changes(conn)
+    version = read_guest_version(conn)
+    local = range(version if since is None else since + 1, version + 1)
+    for pending in (stats.local_versions, guest_store.local_versions):
+        pending.expect(*local)
+    try:
+        conn.commit()
+    except BaseException:
+        for pending in (stats.local_versions, guest_store.local_versions):
+            pending.forget(*local)
+        raise
+    return version
+
+def publish_guest(op, key, name=None, seat=None, seat_en=None, old_key=None):
+    hub.publish("guest", {
+        "op": op, "key": key, "old_key": old_key,
+        "name": name, "seat": seat, "seat_en": seat_en,
+    })
+
+@timed("load_guests")
 def load_guests():
     """
     ส่งออกเป็น dict:
     { name_key: {"seat":..., "seat_en":..., "display_name": ... } }
-    """
-    result = {}
 
-    with get_conn() as conn:
-        rows = conn.execute("SELECT name_key, seat, seat_en, display_name FROM guests").fetchall()
-        for r in rows:
-            result[r["name_key"]] = {
-                "seat": r["seat"],
-                "seat_en": r["seat_en"],
-                "display_name": r.get("display_name") or r["name_key"]
-            }
-    if result:
-        return result
-
-    # fallback: CSV (เผื่อ DB ว่าง)
-    try:
-        with open(GUEST_CSV_PATH, encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for r in reader:
-                k = (r.get("name") or "").strip().lower()
-                if not k: 
-                    continue
-                result[k] = {
-                    "seat": (r.get("seat") or "").strip(),
-                    "seat_en": (r.get("seat_en") or "").strip(),
-                    "display_name": (r.get("name") or "").strip() or k
-                }
-    except FileNotFoundError:
-        pass
-    return result
+    อ่านจาก guest_store (cache ในหน่วยความจำ) ไม่เปิด DB ทุก request อีกต่อไป
+    """
+    return guest_store.snapshot()
 
 
+@timed("save_guests_to_csv")
 def save_guests_to_csv():
-    """Dump current guests to guests.csv so data survives restarts."""
-    with get_conn() as conn:
-        rows = conn.execute(
-            "SELECT display_name, seat, seat_en FROM guests ORDER BY seat, display_name"
-        ).fetchall()
-    with open(GUEST_CSV_PATH, "w", newline="", encoding="utf-8") as f:
+    """Dump current guests to guests.csv so data survives restarts (atomic rename)."""
+    def write(f):
         writer = csv.writer(f)
-        writer.writerow(["name", "seat", "seat_en"])
-        for r in rows:
-            writer.writerow([r["display_name"], r["seat"], r["seat_en"]])
-            
+        writer.writerow(["name", "seat", "seat_en", "token"])
+        n = 0
+        with get_conn() as conn:
+            rows = conn.execute(
+                "SELECT COALESCE(display_name, name_key) AS name, seat, seat_en, checkin_token "
+                "FROM guests ORDER BY seat, name"
+            )
+            for r in rows:
+                writer.writerow([r["name"], r["seat"], r["seat_en"], r["checkin_token"]])
+                n += 1
+        return n
+    return write_atomic(GUEST_CSV_PATH, write)
+
+# เขียน guests.csv แบบรวบหลายการแก้ไขเป็นครั้งเดียว (ไม่ทำบน request thread)
+csv_snapshot = CsvSnapshotter(save_guests_to_csv)
+
+# DB คิวเต็ม -> 503 ให้ client ลองใหม่ (ดีกว่าปล่อยทุกคำขอค้างจน timeout)
+@app.exception_handler(DatabaseBusy)
+async def database_busy_handler(request: Request, exc: DatabaseBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "error": "ระบบกำลังยุ่ง กรุณาลองใหม่ / Server busy, please try again."},
+        headers={"Retry-After": "1"},
+    )
+
 # -----------------------------
 # Startup
 # -----------------------------
 @app.on_event("startup")
 def on_startup():
-    init_db()
+    assets.build(PAGES)
+    build_seat_map()
+    global checkins_fts
+    init_db(GUEST_CSV_PATH)
+    with get_conn() as conn:
+        checkins_fts = has_checkins_fts(conn)
+    guest_store.load()
+    stats.load()
+    feed.start(stats.last_id, stats.guest_version)
+    checkin_log.start()
+    csv_snapshot.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    checkin_log.stop()      # drain คิว log ให้ครบก่อนปิด connection
+    feed.stop()
+    csv_snapshot.stop()     # เขียน guests.csv ที่ยังค้าง
+    profiler.stop()
+    guest_store.close()
+    close_pool()
 
 # -----------------------------
 # Admin utils
 # -----------------------------
-SEAT_PATTERN = re.compile(r"^[A-L][1-9]$", re.IGNORECASE)
+SEAT_PATTERN = re.compile(r"^[A-N][1-9]$", re.IGNORECASE)
 
 def admin_guard(request: Request):
     if not ADMIN_KEY:
@@ -191,6 +213,24 @@ def admin_guard(request: Request):
     if request.headers.get("X-Admin-Key") != ADMIN_KEY:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
+# EventSource ตั้ง header เองไม่ได้ ถ้าใส่ admin key ใน URL จะไปค้างใน access log / history
+# จึงแลก key (ผ่าน header) เป็น token อายุสั้นสำหรับ /api/admin/stream แทน
+# token = "<หมดอายุ>.<HMAC ด้วย ADMIN_KEY>" ไม่ต้องเก็บ state: worker ไหนก็ตรวจได้
+STREAM_TOKEN_TTL = 60
+
+def _stream_token_sig(expires: str) -> str:
+    return hmac.new(ADMIN_KEY.encode(), f"stream:{expires}".encode(), hashlib.sha256).hexdigest()
+
+def issue_stream_token() -> str:
+    expires = str(int(time.time()) + STREAM_TOKEN_TTL)
+    return f"{expires}.{_stream_token_sig(expires)}"
+
+def check_stream_token(token: Optional[str]) -> bool:
+    expires, _, sig = (token or "").partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(sig, _stream_token_sig(expires))
+
 def normalize_seat(s: str) -> str:
     s = (s or "").strip().upper()
     if not SEAT_PATTERN.match(s):
@@ -203,98 +243,345 @@ def seat_to_en(s: str) -> str:
 # -----------------------------
 # Routes: Check-in (frontend API)
 # -----------------------------
+@timed("lookup_guest")
+def lookup_guest(name_key):
+    """(guests, ranked) — เรียกผ่าน run_db เพราะ cache อาจต้องถาม DB ว่ามีใครแก้รายชื่อ"""
+    ranked = guest_store.search(name_key)
+    # ไม่พบ/กำกวม: worker อื่นอาจเพิ่งเพิ่มหรือเปลี่ยนชื่อ ตรวจ DB ทันที (ไม่รอรอบ check_interval)
+    # ก่อนตอบ miss ที่จะถูกจดลง log ถาวร
+    if best_match(ranked) is None and guest_store.refresh_if_stale(force=True):
+        ranked = guest_store.search(name_key)
+    return load_guests(), ranked
+
 @app.post("/checkin")
 async def checkin(request: Request, name: str = Form(...)):
-    guests = load_guests()
     name_raw = (name or "").strip()
     name_key = name_raw.lower()
 
-    # หาในรายชื่อ (ยอมรับพิมพ์แค่บางส่วน)
-    found = None
-    matched_key = None
-    for gk, gv in guests.items():
-        if name_key in gk:
-            found = gv
-            matched_key = gk
-            break
+    # หาในรายชื่อ (ยอมรับพิมพ์แค่บางส่วน) ผ่าน name index
+    # งาน SQLite ทุกอย่างในเส้นทางนี้วิ่งบน executor ไม่บล็อก event loop
+    guests, ranked = await run_db(lookup_guest, name_key)
+    matched_key = best_match(ranked)
+    found = guests.get(matched_key) if matched_key else None
 
     # context สำหรับ log
     ua = request.headers.get("user-agent", "-")
     ip = request.client.host if request.client else "-"
     now_th = datetime.now(TH_TZ).strftime("%Y-%m-%d %H:%M:%S")
 
-    # ถ้าไม่พบชื่อใน master
+    # ถ้าไม่พบชื่อใน master (หรือพบหลายชื่อที่ใกล้เคียงกันพอ ๆ กัน)
     if not found:
         # log ความพยายามที่ไม่พบชื่อไว้เหมือนเดิม
-        with get_conn() as conn:
-            
-            conn.execute(
-                "INSERT INTO checkins (name, seat, seat_en, user_agent, ip, created_at) "
-                "VALUES (?,?,?,?,?,?)",
-                (name_raw, None, None, ua, ip, now_th),
-            )
-            conn.commit()
+        pending = await run_db(checkin_log.record_miss, name_raw, ua, ip, now_th)
+        CHECKINS.inc("ambiguous" if ranked else "not_found")
+        if pending is not None:
+            await asyncio.wrap_future(pending)
+        if ranked:
+            # ไม่เดาเอง: ส่งรายชื่อที่เป็นไปได้ให้ผู้ใช้เลือก
+            candidates = [
+                guests[k].get("display_name") or k
+                for _, k in ranked if k in guests
+            ]
+            return {
+                "success": False,
+                "ambiguous": True,
+                "candidates": candidates,
+                "error": "พบหลายรายชื่อ กรุณาเลือกชื่อของคุณ / Multiple names match, please choose yours.",
+            }
+        if is_short_query(name_key):
+            # คำค้นสั้นเกิน index หาแค่ชื่อที่ตรงทั้งชื่อ (ไม่ scan ทุกคน)
+            return {"success": False, "error": "กรุณาพิมพ์ชื่ออย่างน้อย 3 ตัวอักษร / Please type at least 3 characters of your name."}
         return {"success": False, "error": "ไม่พบชื่อในระบบ / Name not found."}
 
 
-    seat = found["seat"]
-    seat_en = found["seat_en"]
     # ใช้ชื่อเต็มจากฐาน (ถ้าไม่มี ให้ fallback เป็น matched_key หรือ name_raw)
     canonical_name = (found.get("display_name") or matched_key or name_raw).strip()
+    return await complete_checkin(matched_key, canonical_name, found["seat"], found["seat_en"], ua, ip, now_th)
+
+async def complete_checkin(name_key, name, seat, seat_en, ua, ip, now_th):
+    """บันทึกเช็คอินของแขกที่หาเจอแล้ว + คำตอบสำเร็จ (ใช้ทั้งพิมพ์ชื่อและสแกน QR)"""
+    # ตรวจว่าเคยเช็คอินแล้วหรือยัง จากสถานะต่อแขกใน guest_checkins (PK lookup)
+    # พร้อมบันทึก log การเช็คอินซ้ำด้วย (ช่วยให้เห็นประวัติ)
+    already, pending = await run_db(
+        checkin_log.record_checkin,
+        name_key, name, seat, seat_en, ua, ip, now_th,
+    )
+    CHECKINS.inc("duplicate" if already else "hit")
+    if pending is not None:
+        await asyncio.wrap_future(pending)
+
+    return {
+        "success": True,
+        "seat": seat,
+        "seat_en": seat_en,
+        "already": already,
+        "seat_map": seat_map_url(seat),
+    }
+
+def lookup_token(token):
+    with get_conn() as conn:
+        return find_guest(conn, token)
 
-    # ตรวจว่าเคยเช็คอินแล้วหรือยัง (ถือว่า 'เคย' ถ้ามีชื่อ+ที่นั่งนี้อย่างน้อย 1 แถว)
-    # ปล. ถ้าคุณต้องการให้เทียบด้วย "ชื่อเต็มตามฐาน" ให้เปลี่ยน name_raw เป็น matched_key หรือชื่อ canonical ที่คุณเก็บไว้
+@app.post("/checkin/token/{token}")
+async def checkin_token(request: Request, token: str):
+    """
+    เช็คอินด้วย token จาก QR (หน้าแรกเปิดด้วย /?t=<token> แล้วเรียก endpoint นี้)
+    หาแขกด้วย unique index ของ guests.checkin_token ครั้งเดียว แทนการค้นชื่อ
+    log / "already" เหมือน /checkin ทุกอย่าง
+    """
+    ua = request.headers.get("user-agent", "-")
+    ip = request.client.host if request.client else "-"
+    now_th = datetime.now(TH_TZ).strftime("%Y-%m-%d %H:%M:%S")
 
-    with get_conn() as conn:
-        row = conn.execute(
-            "SELECT 1 AS ok FROM checkins WHERE name=? AND seat=? LIMIT 1",
-            (canonical_name, seat),
-        ).fetchone()
-        already = bool(row)
+    row = await run_db(lookup_token, token) if is_token(token) else None
+    if row is None:
+        # รูปแบบผิดไม่ต้อง log (กันขยะจากคนสุ่ม URL)
+        if is_token(token):
+            pending = await run_db(checkin_log.record_miss, f"token:{token}", ua, ip, now_th)
+            if pending is not None:
+                await asyncio.wrap_future(pending)
+        CHECKINS.inc("not_found")
+        return {"success": False, "error": "ไม่พบ QR นี้ในระบบ / Unknown QR code."}
 
-        # จะบันทึก log การเช็คอินซ้ำด้วยก็ได้ (ช่วยให้เห็นประวัติ)
-        conn.execute(
-            "INSERT INTO checkins (name, seat, seat_en, user_agent, ip, created_at) "
-            "VALUES (?,?,?,?,?,?)",
-            (canonical_name, seat, seat_en, ua, ip, now_th),
-        )
-        conn.commit()
+    name = (row["display_name"] or row["name_key"]).strip()
+    return await complete_checkin(row["name_key"], name, row["seat"], row["seat_en"], ua, ip, now_th)
 
 
-    return {"success": True, "seat": seat, "seat_en": seat_en, "already": already}
+# -----------------------------
+# Routes: Kiosk sync (ดู kiosk_sync.py)
+# -----------------------------
+def kiosk_guard(request: Request):
+    if not (KIOSK_KEY or ADMIN_KEY):
+        raise HTTPException(status_code=500, detail="Missing KIOSK_KEY")
+    if KIOSK_KEY and request.headers.get("X-Kiosk-Key") == KIOSK_KEY:
+        return
+    if ADMIN_KEY and request.headers.get("X-Admin-Key") == ADMIN_KEY:
+        return
+    raise HTTPException(status_code=401, detail="Unauthorized")
+
+def json_bytes(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# snapshot เต็มล่าสุด (version, body, gzip body): kiosk หลายเครื่องเปิดพร้อมกันสร้างครั้งเดียว
+kiosk_snapshot_cache = (None, b"", b"")
+
+def kiosk_guests_body(since):
+    """(version, body, gzip body หรือ None) ของ delta ตั้งแต่ since หรือ snapshot เต็ม"""
+    global kiosk_snapshot_cache
+    with get_conn() as conn:
+        if since is not None:
+            delta = read_changes(conn, since)
+            if delta is not None:
+                body = json_bytes(delta)
+                return delta["version"], body, gzip.compress(body, 6) if len(body) > 1024 else None
+        cached = kiosk_snapshot_cache
+        if cached[0] == read_guest_version(conn):
+            return cached
+        snap = read_snapshot(conn)
+    body = json_bytes(snap)
+    kiosk_snapshot_cache = (snap["version"], body, gzip.compress(body, 6))
+    return kiosk_snapshot_cache
+
+@app.get("/api/kiosk/guests")
+async def api_kiosk_guests(request: Request, since: Optional[int] = Query(None, ge=0)):
+    """
+    รายชื่อสำหรับ kiosk: ไม่มี since = snapshot เต็ม, มี since = เฉพาะที่เปลี่ยน
+    ("full": true ถ้า change log ไม่ครอบคลุม since ให้แทนที่รายชื่อในเครื่องทั้งหมด)
+    """
+    kiosk_guard(request)
+    version, body, gz = await run_db(kiosk_guests_body, since, lane="kiosk")
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding", "X-Guest-Version": str(version)}
+    if since is None:
+        etag = f'"guests-{version}"'
+        headers["ETag"] = etag
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+    if gz is not None and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gz
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type="application/json", headers=headers)
+
+@timed("ingest_offline_checkins")
+def ingest_offline_checkins(kiosk_id, entries, ip):
+    """หาแขกของแต่ละรายการด้วยรายชื่อปัจจุบันบน server แล้วเขียนทั้ง batch ใน transaction เดียว"""
+    guests = load_guests()
+    ua = f"kiosk:{kiosk_id}"
+    batch = []
+    for e in entries:
+        # ใช้ key ที่ kiosk หาเจอ ถ้ารายชื่อในเครื่องเก่าไปก็หาจากชื่อที่พิมพ์ใหม่
+        key = e["key"] if e["key"] in guests else None
+        if key is None and e["name"]:
+            key = best_match(guest_store.search(e["name"].lower()))
+        found = guests.get(key) if key else None
+        if found:
+            name = (found.get("display_name") or key).strip()
+            batch.append((e["id"], key, (name, found["seat"], found["seat_en"], ua, ip, e["at"])))
+        else:
+            batch.append((e["id"], None, (e["name"] or e["key"], None, None, ua, ip, e["at"])))
+
+    results = []
+    for e, r in zip(entries, checkin_log.record_batch(kiosk_id, batch)):
+        found = guests.get(r["name_key"]) if r["name_key"] else None
+        if not r["replayed"]:
+            CHECKINS.inc("not_found" if r["name_key"] is None else "duplicate" if r["already"] else "hit")
+        results.append({
+            "id": e["id"],
+            "success": r["name_key"] is not None,
+            "seat": found["seat"] if found else None,
+            "seat_en": found["seat_en"] if found else None,
+            "already": r["already"],
+            "replayed": r["replayed"],
+        })
+    return {"ok": True, "version": guest_store.version, "results": results}
+
+@app.post("/api/kiosk/checkins")
+async def api_kiosk_checkins(
+    request: Request,
+    kiosk_id: str = Body(..., embed=True),
+    checkins: list = Body(..., embed=True),
+):
+    """
+    อัปโหลดเช็คอินที่ kiosk คิวไว้ตอน offline (ส่ง batch เดิมซ้ำได้ ดู kiosk_sync.py)
+    ผลต่อรายการตามลำดับเดิม + version รายชื่อปัจจุบัน (ถ้าใหม่กว่าในเครื่องให้ดึง delta)
+    """
+    kiosk_guard(request)
+    kiosk_id = (kiosk_id or "").strip()[:64]
+    if not kiosk_id:
+        raise HTTPException(status_code=400, detail="kiosk_id is required")
+    now_th = datetime.now(TH_TZ).strftime("%Y-%m-%d %H:%M:%S")
+    entries, errors = parse_offline_checkins(checkins, now_th)
+    if errors:
+        raise HTTPException(status_code=400, detail={"errors": errors})
+    ip = request.client.host if request.client else "-"
+    return await run_db(ingest_offline_checkins, kiosk_id, entries, ip, lane="kiosk")
 
 
 # -----------------------------
 # Routes: Admin APIs
 # -----------------------------
+CHECKINS_PAGE_MAX = 1000
+# trigram ต้องมีอย่างน้อย 3 ตัวอักษร; checkins_fts = False ถ้า SQLite ไม่มี fts5 (ดู db.py)
+CHECKINS_FTS_MIN_QUERY = 3
+checkins_fts = False
+
 @app.get("/api/admin/checkins")
-def api_admin_checkins(request: Request):
+@offload("admin")
+def api_admin_checkins(
+    request: Request,
+    limit: int = Query(200, ge=1, le=CHECKINS_PAGE_MAX),
+    before_id: Optional[int] = None,
+    since_id: Optional[int] = None,
+    seat: Optional[str] = None,
+    q: Optional[str] = None,
+    status: Optional[str] = None,
+    time_from: Optional[str] = Query(None, alias="from"),
+    time_to: Optional[str] = Query(None, alias="to"),
+):
+    """
+    Check-in log แบบแบ่งหน้า (keyset บน id)
+
+    - ปกติ: ใหม่สุดก่อน หน้าถัดไปส่ง before_id=next_before_id
+    - since_id: เฉพาะแถวที่ใหม่กว่า id นั้น เรียงเก่า->ใหม่ (dashboard ดึงเฉพาะส่วนที่เพิ่ม)
+      ถ้า has_more ให้เรียกต่อด้วย since_id = id สุดท้ายที่ได้
+    - ตัวกรอง: seat, q (บางส่วนของชื่อ), status=ok|notfound, from/to (เวลา)
+      q ตั้งแต่ CHECKINS_FTS_MIN_QUERY ตัวอักษรค้นผ่าน checkins_fts (trigram)
+      สั้นกว่านั้นต้องอ่าน log ทีละแถว จึงต้องมี seat หรือ from/to (หรือ since_id) มาด้วย
+    """
     admin_guard(request)
+
+    q = (q or "").strip().lower()
+    seat = (seat or "").strip().upper()
+    use_fts = checkins_fts and len(q) >= CHECKINS_FTS_MIN_QUERY
+    if q and not use_fts and not (seat or time_from or time_to or since_id is not None):
+        raise HTTPException(
+            status_code=400,
+            detail=f"q shorter than {CHECKINS_FTS_MIN_QUERY} characters needs a seat or from/to filter",
+        )
+
+    # ค้นชื่อผ่าน FTS: เดินตาม rowid ของ checkins_fts (= checkins.id) หยุดได้เมื่อครบ limit
+    id_col = "f.rowid" if use_fts else "c.id"
+    where, params = [], []
+    if use_fts:
+        where.append("checkins_fts MATCH ?")
+        params.append('"' + q.replace('"', '""') + '"')
+    elif q:
+        where.append("instr(lower(c.name), ?) > 0")
+        params.append(q)
+    if since_id is not None:
+        where.append(f"{id_col} > ?")
+        params.append(since_id)
+    if before_id is not None:
+        where.append(f"{id_col} < ?")
+        params.append(before_id)
+    if seat:
+        where.append("c.seat = ?")
+        params.append(seat)
+    if status == "ok":
+        where.append("c.seat IS NOT NULL")
+    elif status == "notfound":
+        where.append("c.seat IS NULL")
+    elif status:
+        raise HTTPException(status_code=400, detail="status must be ok or notfound")
+    # รับทั้ง "2025-01-31 18:00" และแบบ datetime-local "2025-01-31T18:00"
+    if time_from:
+        where.append("c.created_at >= ?")
+        params.append(time_from.replace("T", " "))
+    if time_to:
+        where.append("c.created_at <= ?")
+        params.append(time_to.replace("T", " "))
+
+    order = "ASC" if since_id is not None and before_id is None else "DESC"
+    sql = (
+        "SELECT c.id, c.name, c.seat, c.seat_en, c.user_agent, c.ip, c.created_at"
+        + (" FROM checkins_fts f JOIN checkins c ON c.id = f.rowid" if use_fts else " FROM checkins c")
+        + (" WHERE " + " AND ".join(where) if where else "")
+        + f" ORDER BY {id_col} {order} LIMIT ?"
+    )
     with get_conn() as conn:
-        rows = conn.execute(
-            """
-            SELECT id, name, seat, seat_en, user_agent, ip, created_at
-            FROM checkins
-            ORDER BY created_at DESC, id DESC
-            """
-        ).fetchall()
-    return {"items": rows}
+        # ขอเกินมา 1 แถวเพื่อรู้ว่ายังมีหน้าต่อไปหรือไม่
+        rows = conn.execute(sql, (*params, limit + 1)).fetchall()
+        latest = conn.execute("SELECT MAX(id) AS m FROM checkins").fetchone()["m"]
+
+    has_more = len(rows) > limit
+    items = [dict(r) for r in rows[:limit]]
+    return {
+        "items": items,
+        "has_more": has_more,
+        "next_before_id": items[-1]["id"] if has_more and order == "DESC" else None,
+        "latest_id": latest or 0,
+    }
+
+# (dict จาก guest_store, body) — guest_store สร้าง dict ใหม่ทุกครั้งที่แก้ จึงเทียบด้วย `is` ได้
+# รายชื่อหลายหมื่นคน: สร้าง/เรียง/encode ใหม่ทุก request กิน CPU (และ GIL) แย่งกับ /checkin
+admin_guests_cache = (None, b"")
 
 @app.get("/api/admin/guests")
+@offload("admin")
 def api_admin_guests(request: Request):
+    global admin_guests_cache
     admin_guard(request)
     guests = load_guests()
-    items = [
-        {
-            "name": v.get("display_name") or k,
-            "seat": v["seat"],
-            "seat_en": v["seat_en"],
-            "key": k,
-        }
-        for k, v in guests.items()
-    ]
-    items.sort(key=lambda x: (x["seat"], x["name"]))
-    return {"items": items}
+    cached = admin_guests_cache
+    if cached[0] is not guests:
+        items = [
+            {
+                "name": v.get("display_name") or k,
+                "seat": v["seat"],
+                "seat_en": v["seat_en"],
+                "key": k,
+            }
+            for k, v in guests.items()
+        ]
+        items.sort(key=lambda x: (x["seat"], x["name"]))
+        cached = admin_guests_cache = (guests, json_bytes({"items": items}))
+    return Response(cached[1], media_type="application/json")
+
+
+@app.get("/api/admin/stats")
+def api_admin_stats(request: Request):
+    """ยอดผู้มาร่วมงานจากตัวนับในหน่วยความจำ (ไม่ query DB)"""
+    admin_guard(request)
+    return stats.snapshot()
 
 
 # === Admin: add/insert guest (JSON body) ===
@@ -303,6 +590,8 @@ from fastapi import Body
 from fastapi import Body
 
 @app.post("/api/admin/guest")
+@offload("admin")
+@retry_busy
 def api_admin_add_guest(
     request: Request,
     name: str = Body(...),
@@ -325,6 +614,8 @@ def api_admin_add_guest(
         raise HTTPException(status_code=400, detail="Seat must be A1..N9")
 
     with get_conn() as conn:
+        # ล็อกการเขียนก่อนตรวจซ้ำ: worker อื่นจะเพิ่มชื่อ/ที่นั่งเดียวกันแทรกไม่ได้
+        conn.execute("BEGIN IMMEDIATE")
 
         if conn.execute("SELECT 1 FROM guests WHERE name_key=?", (name_key,)).fetchone():
             raise HTTPException(status_code=409, detail="ชื่อนี้ถูกเพิ่มไว้แล้ว")
@@ -333,15 +624,23 @@ def api_admin_add_guest(
             raise HTTPException(status_code=409, detail="ที่นั่งนี้มีผู้ใช้งานแล้ว")
 
         conn.execute(
-            "INSERT INTO guests(name_key, seat, seat_en, display_name) VALUES (?,?,?,?)",
-            (name_key, seat, seat_en, display_name),
+            "INSERT INTO guests(name_key, seat, seat_en, display_name, checkin_token) VALUES (?,?,?,?,?)",
+            (name_key, seat, seat_en, display_name, new_token()),
         )
-        conn.commit()
+        version = commit_guest_change(conn)
 
-    save_guests_to_csv()
+    guest_store.apply_change(version, upserts={
+        name_key: {"seat": seat, "seat_en": seat_en, "display_name": display_name},
+    })
+    stats.guest_added(name_key, seat, version)
+    publish_guest("add", name_key, display_name, seat, seat_en)
+
+    csv_snapshot.mark_dirty()
     return {"ok": True}
 
 @app.put("/api/admin/guest/{name_key}")
+@offload("admin")
+@retry_busy
 def api_admin_update_guest(
     request: Request,
     name_key: str,
@@ -359,7 +658,12 @@ def api_admin_update_guest(
     if not new_key:
         raise HTTPException(status_code=400, detail="name is required")
 
+    if new_key != name_key:
+        # ให้ log ที่ค้างในคิวลง DB ก่อน สถานะเช็คอินจะได้ย้ายตามชื่อใหม่ครบ
+        checkin_log.flush()
+
     with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
         if not conn.execute("SELECT 1 FROM guests WHERE name_key=?", (name_key,)).fetchone():
             raise HTTPException(status_code=404, detail="guest not found")
 
@@ -379,34 +683,318 @@ def api_admin_update_guest(
             "UPDATE guests SET name_key=?, display_name=?, seat=?, seat_en=? WHERE name_key=?",
             (new_key, display_name, seat, seat_en, name_key),
         )
-        conn.commit()
-
-    save_guests_to_csv()
+        last_log_id = None
+        if new_key != name_key:
+            # ย้ายสถานะเช็คอินตามชื่อใหม่ด้วย
+            conn.execute(
+                "UPDATE OR REPLACE guest_checkins SET name_key=? WHERE name_key=?",
+                (new_key, name_key),
+            )
+            # log ถึง id นี้ยังเป็นชื่อเก่า: stats นับให้ครบก่อนย้าย (feed อาจยังส่งมาไม่ถึง)
+            last_log_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM checkins").fetchone()[0]
+        version = commit_guest_change(conn)
+
+    guest_store.apply_change(version, deletes=[name_key], upserts={
+        new_key: {"seat": seat, "seat_en": seat_en, "display_name": display_name},
+    })
+    if new_key != name_key:
+        checkin_log.rename(name_key, new_key)
+    stats.guest_updated(name_key, new_key, seat, version, last_log_id)
+    publish_guest("update", new_key, display_name, seat, seat_en, old_key=name_key)
+
+    csv_snapshot.mark_dirty()
     return {"ok": True}
 
 
 @app.delete("/api/admin/guest/{name_key}")
+@offload("admin")
+@retry_busy
 def api_admin_delete_guest(request: Request, name_key: str):
     admin_guard(request)
     with get_conn() as conn:
-        conn.execute("DELETE FROM guests WHERE name_key=?", (name_key,))
-        conn.commit()
-    save_guests_to_csv()
+        conn.execute("BEGIN IMMEDIATE")
+        deleted = conn.execute("DELETE FROM guests WHERE name_key=?", (name_key,)).rowcount
+        version = commit_guest_change(conn)
+    guest_store.apply_change(version, deletes=[name_key])
+    if deleted:
+        stats.guest_deleted(name_key, version)
+        publish_guest("delete", name_key)
+    csv_snapshot.mark_dirty()
     return {"ok": True}
 
 
+# === Admin: bulk import / export ===
+@timed("import_guests")
+def import_guests(raw, mode, dry_run):
+    """ตรวจไฟล์ทั้งหมดในหน่วยความจำก่อน แล้วค่อยเขียนใน transaction เดียว"""
+    lines = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+    try:
+        rows, errors = parse_guest_csv(lines, normalize_seat, seat_to_en)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8")
+    if errors:
+        raise HTTPException(status_code=400, detail={"errors": errors})
+
+    plan = write_import(rows, mode, dry_run)
+    changed = plan["added"] or plan["updated"] or plan["removed"]
+    if changed and not dry_run:
+        # เปลี่ยนทีละมาก ๆ: โหลด cache/ตัวนับใหม่ทั้งก้อน แล้วให้ dashboard โหลดใหม่
+        guest_store.load()
+        stats.load()
+        csv_snapshot.mark_dirty()
+        hub.publish("reset", {})
+
+    return {
+        "ok": True,
+        "mode": mode,
+        "dry_run": dry_run,
+        "rows": len(rows),
+        **{k: len(plan[k]) for k in ("added", "updated", "unchanged", "removed")},
+    }
+
+@retry_busy
+def write_import(rows, mode, dry_run):
+    """เทียบกับรายชื่อเดิมแล้วเขียน (ลองใหม่ได้ทั้งก้อนถ้าชน lock กับ worker อื่น)"""
+    with get_conn() as conn:
+        if not dry_run:
+            # ล็อกการเขียนตั้งแต่ตอนอ่านรายชื่อเดิม ไม่ให้มีใครแก้แทรกระหว่างเทียบ
+            conn.execute("BEGIN IMMEDIATE")
+            before = read_guest_version(conn)
+        existing = {
+            r["name_key"]: (r["name"], r["seat"], r["seat_en"])
+            for r in conn.execute(
+                "SELECT name_key, COALESCE(display_name, name_key) AS name, seat, seat_en FROM guests"
+            )
+        }
+        plan = plan_import(existing, rows, mode)
+        if plan["conflicts"]:
+            raise HTTPException(status_code=409, detail={"conflicts": plan["conflicts"]})
+        if not dry_run:
+            apply_import(conn, rows, plan, mode)
+            assign_missing_tokens(conn)     # แถวเดิมที่ยังไม่มี token (เพิ่มผ่าน CLI ฯลฯ)
+            commit_guest_change(conn, since=before)
+    return plan
+
+@app.post("/api/admin/guests/import")
+async def api_admin_import_guests(request: Request, mode: str = "upsert", dry_run: bool = False):
+    """
+    นำเข้ารายชื่อจาก CSV (body = ไฟล์ดิบ, หัวตาราง name,seat[,seat_en])
+    mode=upsert|replace, dry_run=true ตรวจอย่างเดียวไม่เขียน
+    """
+    admin_guard(request)
+    if mode not in IMPORT_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(IMPORT_MODES)}")
+
+    # รับ body ทีละ chunk ลงไฟล์ชั่วคราว (เกิน 1 MB จะลงดิสก์) ไม่กองไว้ในหน่วยความจำ
+    with tempfile.SpooledTemporaryFile(max_size=1 << 20) as raw:
+        async for chunk in request.stream():
+            raw.write(chunk)
+        raw.seek(0)
+        return await run_db(import_guests, raw, mode, dry_run, lane="admin")
+
+EXPORT_BATCH = 1000
+
+def iter_guests_csv(bom=False):
+    """CSV ทีละ EXPORT_BATCH แถว (keyset บน name_key) ไม่โหลดทั้งตาราง"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["name", "seat", "seat_en", "token"])
+    yield ("\ufeff" if bom else "") + buf.getvalue()
+    last = ""
+    while True:
+        with get_conn() as conn:
+            rows = conn.execute(
+                "SELECT name_key, COALESCE(display_name, name_key) AS name, seat, seat_en, checkin_token "
+                "FROM guests WHERE name_key > ? ORDER BY name_key LIMIT ?",
+                (last, EXPORT_BATCH),
+            ).fetchall()
+        if not rows:
+            return
+        buf.seek(0)
+        buf.truncate()
+        for r in rows:
+            writer.writerow([r["name"], r["seat"], r["seat_en"], r["checkin_token"]])
+        yield buf.getvalue()
+        last = rows[-1]["name_key"]
+
+@app.get("/api/admin/guests/export")
+def api_admin_export_guests(request: Request, bom: bool = False):
+    """ดาวน์โหลดรายชื่อเป็น CSV (bom=true สำหรับเปิดด้วย Excel)"""
+    admin_guard(request)
+    return StreamingResponse(
+        iter_guests_csv(bom),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="guests.csv"'},
+    )
+
+@app.post("/api/admin/snapshot")
+@offload("admin")
+def api_admin_snapshot(request: Request):
+    """เขียน guests.csv ทันที (ไม่รอ debounce) เช่นก่อนสำรองไฟล์"""
+    admin_guard(request)
+    rows = csv_snapshot.flush()
+    return {"ok": True, "rows": rows, "path": str(GUEST_CSV_PATH)}
+
+# === Metrics / profiler ===
+Gauge("checkin_db_lane_running", "DB jobs running per executor lane.", ("lane",),
+      collect=lambda: {(name,): lane.running for name, lane in lanes.items()})
+Gauge("checkin_db_lane_waiting", "DB jobs waiting for a lane slot.", ("lane",),
+      collect=lambda: {(name,): lane.waiting for name, lane in lanes.items()})
+Gauge("checkin_sse_clients", "Connected admin live-feed clients.",
+      collect=lambda: {(): hub.client_count})
+
+profiler = SamplingProfiler()
+
+@app.get("/metrics")
+def metrics_endpoint(request: Request):
+    """Prometheus text format (ค่าของ process นี้)"""
+    if METRICS_KEY and request.headers.get("Authorization") != f"Bearer {METRICS_KEY}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/api/admin/profiler")
+def api_admin_profiler_toggle(
+    request: Request,
+    enabled: bool = Body(..., embed=True),
+    interval_ms: float = Body(5, embed=True),
+    duration_s: float = Body(60, embed=True),
+):
+    """เปิด/ปิด sampling profiler ขณะรันอยู่ (เปิดใหม่ = เริ่มเก็บใหม่)"""
+    admin_guard(request)
+    if enabled:
+        profiler.start(interval=interval_ms / 1000, duration=duration_s)
+    else:
+        profiler.stop()
+    return profiler.report(limit=0)
+
+@app.get("/api/admin/profiler")
+def api_admin_profiler(request: Request, limit: int = Query(50, ge=0, le=1000), format: str = "json"):
+    """ผลล่าสุด: top stacks (json) หรือทั้งหมดแบบ folded สำหรับ flamegraph"""
+    admin_guard(request)
+    if format == "folded":
+        return Response(profiler.folded(), media_type="text/plain; charset=utf-8")
+    return profiler.report(limit=limit)
+
+# === Admin: live feed (Server-Sent Events) ===
+STREAM_KEEPALIVE = 15
+
+@app.post("/api/admin/stream-token")
+def api_admin_stream_token(request: Request):
+    """token อายุสั้นสำหรับเปิด /api/admin/stream?token=... (ขอใหม่ทุกครั้งที่ต่อสาย)"""
+    admin_guard(request)
+    return {"token": issue_stream_token(), "expires_in": STREAM_TOKEN_TTL}
+
+@app.get("/api/admin/stream")
+async def api_admin_stream(request: Request, token: Optional[str] = None):
+    """
+    ส่ง event "checkin" / "guest" / "reset" ให้ dashboard แบบ real-time
+
+    ยืนยันตัวด้วย ?token= จาก /api/admin/stream-token (หรือ header X-Admin-Key)
+    token ตรวจเฉพาะตอนต่อสาย สายที่เปิดอยู่แล้วไม่ถูกตัดเมื่อ token หมดอายุ
+    ต่อสายใหม่ด้วย Last-Event-ID / ?last_event_id= จะได้ event ที่พลาดไป
+    """
+    if not ADMIN_KEY:
+        raise HTTPException(status_code=500, detail="Missing ADMIN_KEY")
+    if request.headers.get("X-Admin-Key") != ADMIN_KEY and not check_stream_token(token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    queue, backlog = hub.subscribe(last_event_id)
+
+    async def events():
+        try:
+            # สายใหม่: บอก id ปัจจุบัน client จะได้ต่อสายจากตรงนี้แม้ยังไม่มี event ใหม่
+            hello_id = f"id: {hub.last_id}\n" if last_event_id is None else ""
+            yield f"retry: 3000\n{hello_id}event: hello\ndata: {{}}\n\n".encode()
+            sent = last_event_id or 0
+            for event in backlog:
+                sent = event[0]
+                yield format_sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if event[0] <= sent and event[1] != "reset":
+                    continue    # ซ้ำกับ backlog ที่ส่งไปแล้ว
+                sent = event[0]
+                yield format_sse(event)
+        finally:
+            hub.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # -----------------------------
 # Static / Pages
 # -----------------------------
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-@app.get("/")
-def main_page():
-    return FileResponse("index.html")
-
-@app.get("/admin")
-def admin_page():
-    return FileResponse("admin.html")
+# บีบอัด/ใส่ hash ไว้ล่วงหน้าตอน startup (ดู static_assets.py)
+PAGES = ("index.html", "admin.html")
+assets = AssetStore(BASE_DIR / "static", BASE_DIR, cache_dir=DATA_DIR / "static-cache")
+
+def asset_response(request: Request, asset, version=None):
+    status, body, headers = assets.respond(
+        asset, request.headers, version, head=request.method == "HEAD"
+    )
+    return Response(content=body, status_code=status, headers=headers)
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+def static_file(path: str, request: Request, v: Optional[str] = None):
+    asset = assets.files.get(path)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return asset_response(request, asset, v)
+
+# ที่นั่ง -> bbox + แผนผังย่อยรอบโต๊ะ (static/seat-A1.svg) สร้างตอน startup
+seat_map: Optional[SeatMap] = None
+SEAT_MAP_FILE = "seating-map.svg"
+
+def build_seat_map():
+    global seat_map
+    seat_map = SeatMap(assets.files[SEAT_MAP_FILE].body, SEAT_PATTERN)
+    for seat_id in seat_map.seats:
+        assets.add(f"seat-{seat_id}.svg", seat_map.fragment(seat_id))
+
+def seat_map_url(seat_id):
+    """Hashed URL of the per-table fragment, or the full map if the seat isn't drawn."""
+    name = f"seat-{seat_id}.svg"
+    return assets.url(name if name in assets.files else SEAT_MAP_FILE)
+
+@app.get("/api/seats")
+def api_seats(request: Request):
+    """ดัชนีที่นั่งทั้งหมด: bbox ในแผนผังเต็ม, กรอบครอป และ URL แผนผังย่อย"""
+    # ดัชนีสร้างจาก SEAT_MAP_FILE ล้วน ๆ: ใช้ ETag ของไฟล์นั้นได้เลย
+    headers = {"Cache-Control": "no-cache", "ETag": f'"{assets.files[SEAT_MAP_FILE].etag}"'}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    index = {
+        seat_id: {
+            "bbox": box,
+            "view_box": seat_map.table_box(seat_id),
+            "map": seat_map_url(seat_id),
+        }
+        for seat_id, box in sorted(seat_map.seats.items())
+    }
+    body = {"map": assets.url(SEAT_MAP_FILE), "view_box": seat_map.view_box, "seats": index}
+    return JSONResponse(body, headers=headers)
+
+@app.api_route("/", methods=["GET", "HEAD"])
+def main_page(request: Request):
+    return asset_response(request, assets.pages["index.html"])
+
+@app.api_route("/admin", methods=["GET", "HEAD"])
+def admin_page(request: Request):
+    return asset_response(request, assets.pages["admin.html"])
 
 @app.api_route("/ping", methods=["GET", "HEAD"])
 def ping():
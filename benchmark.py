@@ -0,0 +1,375 @@
+# ============================================================
+# benchmark.py — Load test for /checkin and the admin APIs
+# ============================================================
+#
+# สร้างรายชื่อสมมุติ (ชื่อไทย + อังกฤษ) ลง CHECKIN_DATA_DIR ชั่วคราว แล้วยิง
+# /checkin พร้อมกันหลาย worker (ชื่อเต็ม / ชื่อบางส่วน / ชื่อที่ไม่มี)
+# พร้อม worker ฝั่ง admin (list, stats, เพิ่ม/แก้/ลบแขก) ในเวลาเดียวกัน
+# รายงาน throughput, p50/p95/p99 ต่อประเภทคำขอ และขนาด DB ที่โตขึ้น
+#
+#   python benchmark.py --guests 10000 --requests 20000 --concurrency 64
+#   python benchmark.py --uvicorn ...            # ยิงผ่าน uvicorn จริง (HTTP)
+#   python benchmark.py --out bench.json         # เก็บผลเป็น JSON
+#   python benchmark.py --compare bench.json     # เทียบกับ baseline (exit 1 ถ้าแย่ลงเกิน --tolerance)
+#
+# ตัวแปร env ของ app (CHECKIN_WRITE_BEHIND, CHECKIN_DB_POOL_SIZE, ...) ส่งผ่านได้ตามปกติ
+# ต้องใช้ httpx (ไม่อยู่ใน requirements.txt ของ server): pip install -r requirements-dev.txt
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+BASE_DIR = Path(__file__).resolve().parent
+ADMIN_KEY = "bench"
+
+THAI_FIRST = [
+    "สมชาย", "สมหญิง", "วิชัย", "สุดา", "ประเสริฐ", "มาลี", "อนันต์", "กัญญา", "ธนพล", "ศิริพร",
+    "ชัยวัฒน์", "นภา", "สุรเชษฐ์", "พรทิพย์", "กิตติ", "วรรณา", "ณัฐพล", "อรุณี", "ปิยะ", "จันทร์เพ็ญ",
+    "ธีรวัฒน์", "รัตนา", "เอกชัย", "สุนีย์", "บุญมี", "ลำดวน", "พิชิต", "ดวงใจ", "อภิชาติ", "เพ็ญศรี",
+    "ภานุวัฒน์", "ชุติมา", "ยุทธนา", "ปราณี", "วีระ", "สายสุนีย์", "ทรงศักดิ์", "อำไพ", "เกียรติ", "นันทนา",
+]
+THAI_SYLLABLES = [
+    "ใจ", "ดี", "ศรี", "สุข", "ทอง", "แก้ว", "มณี", "วงศ์", "รัตน์", "ชัย", "พันธ์", "เจริญ",
+    "บุญ", "มั่น", "สกุล", "ประ", "เสริฐ", "กุล", "ธรรม", "ศักดิ์", "สวัสดิ์", "พงษ์", "นาค", "สิทธิ์",
+]
+LATIN_FIRST = [
+    "Anna", "Ben", "Chloe", "David", "Emma", "Felix", "Grace", "Henry", "Isla", "Jack",
+    "Kate", "Liam", "Mia", "Noah", "Olivia", "Paul", "Quinn", "Ruby", "Sam", "Tara",
+    "Uma", "Victor", "Wendy", "Xavier", "Yara", "Zoe", "Adam", "Bella", "Carl", "Diana",
+    "Ethan", "Fiona", "George", "Hannah", "Ivan", "Julia", "Kevin", "Laura", "Marco", "Nina",
+]
+LATIN_PREFIX = [
+    "Ash", "Black", "Brook", "Carr", "Dun", "East", "Fair", "Glen", "Hart", "Hill", "King", "Lang",
+    "Mar", "North", "Oak", "Pem", "Red", "Rose", "Stan", "Thorn", "Under", "West", "Whit", "York",
+]
+LATIN_SUFFIX = ["ford", "ley", "ton", "wood", "field", "well", "man", "by", "croft", "ham", "ridge", "worth",
+                "stone", "brook", "dale", "son"]
+SEATS = [f"{t}{n}" for t in "ABCDEFGHIJKLMN" for n in range(1, 10)]
+# โต๊ะ N เว้นว่างไว้ให้ worker ฝั่ง admin เพิ่ม/ลบแขก (1 ที่นั่งต่อ worker)
+GUEST_SEATS = [s for s in SEATS if not s.startswith("N")]
+ADMIN_SEATS = [s for s in SEATS if s.startswith("N")]
+
+
+# -----------------------------
+# Synthetic data
+# -----------------------------
+def synthetic_names(count, seed=1):
+    """``count`` unique names, roughly half Thai and half Latin."""
+    rng = random.Random(seed)
+    names, seen = [], set()
+    while len(names) < count:
+        if rng.random() < 0.5:
+            surname = "".join(rng.choice(THAI_SYLLABLES) for _ in range(rng.choice((2, 3))))
+            name = f"{rng.choice(THAI_FIRST)} {surname}"
+        else:
+            middle = f" {rng.choice('ABCDEFGHJKLMNPRSTW')}." if rng.random() < 0.5 else ""
+            name = f"{rng.choice(LATIN_FIRST)}{middle} {rng.choice(LATIN_PREFIX)}{rng.choice(LATIN_SUFFIX)}"
+        if name.lower() not in seen:
+            seen.add(name.lower())
+            names.append(name)
+    return names
+
+
+def write_guest_csv(path, names):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["name", "seat", "seat_en"])
+        for i, name in enumerate(names):
+            seat = GUEST_SEATS[i % len(GUEST_SEATS)]
+            w.writerow([name, seat, f"Table {seat}"])
+
+
+def checkin_queries(names, total, mix, seed=2):
+    """``[(kind, query)]`` for hit / partial / miss in the given proportions."""
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    out = []
+    for _ in range(total):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "hit":
+            q = rng.choice(names)
+        elif kind == "partial":
+            parts = rng.choice(names).split()
+            q = rng.choice((parts[0], parts[-1], parts[-1][:4]))
+        else:
+            q = "".join(rng.choice("qxzvjk") for _ in range(rng.randint(5, 10)))
+        out.append((kind, q))
+    return out
+
+
+def db_size(data_dir):
+    """Size of checkin.db after folding the WAL back in (so before/after compare like for like)."""
+    path = Path(data_dir) / "checkin.db"
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    return sum(p.stat().st_size for p in Path(data_dir).glob("checkin.db*"))
+
+
+# -----------------------------
+# Report helpers
+# -----------------------------
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+def summarize(samples, errors, elapsed):
+    ops = {}
+    for op in sorted(set(samples) | set(errors)):
+        lat = sorted(samples.get(op, []))
+        ops[op] = {
+            "count": len(lat),
+            "errors": errors.get(op, 0),
+            "rps": round(len(lat) / elapsed, 1) if elapsed else None,
+            **{f"p{p}_ms": round(percentile(lat, p) * 1000, 2) if lat else None for p in (50, 95, 99)},
+        }
+    return ops
+
+
+def print_report(result):
+    meta = result["meta"]
+    print(f"guests={meta['guests']} requests={meta['requests']} concurrency={meta['concurrency']} "
+          f"admin={meta['admin_concurrency']} mode={meta['mode']}")
+    print(f"startup {result['startup_s']:.2f}s  run {result['elapsed_s']:.2f}s  "
+          f"checkin throughput {result['checkin_rps']:.1f} req/s")
+    print(f"db size {result['db_bytes_before'] / 1e6:.2f} MB -> {result['db_bytes_after'] / 1e6:.2f} MB")
+    print(f"{'op':<16}{'count':>8}{'err':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for op, r in result["ops"].items():
+        cells = [r["p50_ms"], r["p95_ms"], r["p99_ms"]]
+        print(f"{op:<16}{r['count']:>8}{r['errors']:>6}{r['rps'] or 0:>9.1f}"
+              + "".join(f"{c:>9.2f}" if c is not None else f"{'-':>9}" for c in cells))
+
+
+def compare(result, baseline, tolerance):
+    """Print deltas vs ``baseline``; return the list of regressions."""
+    regressions = []
+    print(f"\nvs baseline (tolerance {tolerance:.0%}):")
+    keys = ("guests", "requests", "concurrency", "admin_concurrency", "mix", "mode")
+    diff = [k for k in keys if baseline["meta"].get(k) != result["meta"].get(k)]
+    if diff:
+        print(f"  warning: baseline was run with different {', '.join(diff)}")
+    old, new = baseline["checkin_rps"], result["checkin_rps"]
+    print(f"  checkin throughput {old:.1f} -> {new:.1f} req/s")
+    if old and new < old * (1 - tolerance):
+        regressions.append("checkin_rps")
+    for op, r in result["ops"].items():
+        b = baseline["ops"].get(op)
+        if not b or b.get("p95_ms") is None or r["p95_ms"] is None:
+            continue
+        print(f"  {op:<16} p95 {b['p95_ms']:.2f} -> {r['p95_ms']:.2f} ms")
+        if r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{op}.p95_ms")
+    return regressions
+
+
+# -----------------------------
+# Load
+# -----------------------------
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def timed(self, op, request, ok=None):
+        t0 = time.perf_counter()
+        try:
+            resp = await request
+        except httpx.HTTPError:
+            self.errors[op] += 1
+            return None
+        dt = time.perf_counter() - t0
+        if resp.status_code >= 400 or (ok is not None and not ok(resp)):
+            self.errors[op] += 1
+        else:
+            self.samples[op].append(dt)
+        return resp
+
+
+async def checkin_worker(client, rec, queue):
+    while queue:
+        kind, q = queue.pop()
+        ok = (lambda r: r.json().get("success")) if kind == "hit" else None
+        await rec.timed(f"checkin:{kind}", client.post("/checkin", data={"name": q}), ok)
+
+
+async def admin_worker(client, rec, seat, worker_id, stop):
+    h = {"X-Admin-Key": ADMIN_KEY}
+    i = 0
+    while not stop.is_set():
+        i += 1
+        step = i % 6
+        if step == 0:
+            await rec.timed("admin:checkins", client.get("/api/admin/checkins", params={"limit": 100}, headers=h))
+        elif step == 1:
+            await rec.timed("admin:stats", client.get("/api/admin/stats", headers=h))
+        elif step == 2 and worker_id == 0:
+            # รายชื่อทั้งหมดหนัก (ทั้งตาราง) -> ให้ worker เดียวเรียก
+            await rec.timed("admin:guests", client.get("/api/admin/guests", headers=h))
+        elif step == 3:
+            name = f"bench admin {worker_id} {i}"
+            await rec.timed("admin:add", client.post(
+                "/api/admin/guest", json={"name": name, "seat": seat}, headers=h))
+            renamed = f"{name} x"
+            await rec.timed("admin:update", client.put(
+                f"/api/admin/guest/{name}", json={"name": renamed, "seat": seat}, headers=h))
+            await rec.timed("admin:delete", client.delete(f"/api/admin/guest/{renamed}", headers=h))
+        await asyncio.sleep(0)
+
+
+async def drive(client, args, names):
+    mix = {"hit": args.hit, "partial": args.partial, "miss": args.miss}
+    queue = checkin_queries(names, args.requests, mix)
+    queue.reverse()
+    rec = Recorder()
+    stop = asyncio.Event()
+
+    t0 = time.perf_counter()
+    admins = [
+        asyncio.create_task(admin_worker(client, rec, ADMIN_SEATS[i], i, stop))
+        for i in range(min(args.admin_concurrency, len(ADMIN_SEATS)))
+    ]
+    await asyncio.gather(*(checkin_worker(client, rec, queue) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await asyncio.gather(*admins)
+    return rec, elapsed
+
+
+async def run_in_process(args, names):
+    import app as app_module     # import หลังตั้ง env (db.py อ่าน CHECKIN_DATA_DIR ตอน import)
+
+    t0 = time.perf_counter()
+    async with app_module.app.router.lifespan_context(app_module.app):
+        startup = time.perf_counter() - t0
+        before = db_size(os.environ["CHECKIN_DATA_DIR"])
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            rec, elapsed = await drive(client, args, names)
+        # ให้ write-behind (ถ้าเปิด) ลง DB ก่อนวัดขนาด
+        app_module.checkin_log.flush()
+    return rec, elapsed, startup, before
+
+
+async def run_uvicorn(args, names):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR,
+    )
+    base = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=args.concurrency + args.admin_concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base, timeout=60, limits=limits) as client:
+            while True:
+                if proc.poll() is not None:
+                    raise SystemExit("uvicorn exited during startup")
+                try:
+                    if (await client.get("/ping")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            startup = time.perf_counter() - t0
+            before = db_size(os.environ["CHECKIN_DATA_DIR"])
+            rec, elapsed = await drive(client, args, names)
+    finally:
+        proc.send_signal(signal.SIGINT)     # shutdown ปกติ: drain log ก่อนวัดขนาด DB
+        proc.wait(timeout=60)
+    return rec, elapsed, startup, before
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Load test for the check-in service")
+    p.add_argument("--guests", type=int, default=1000, help="synthetic guest count (1k-100k)")
+    p.add_argument("--requests", type=int, default=5000, help="total /checkin requests")
+    p.add_argument("--concurrency", type=int, default=32, help="concurrent /checkin workers")
+    p.add_argument("--admin-concurrency", type=int, default=2, help="concurrent admin workers (max 9)")
+    p.add_argument("--hit", type=float, default=0.7, help="share of full-name queries")
+    p.add_argument("--partial", type=float, default=0.2, help="share of partial-name queries")
+    p.add_argument("--miss", type=float, default=0.1, help="share of unknown names")
+    p.add_argument("--uvicorn", action="store_true", help="run a local uvicorn instead of in-process ASGI")
+    p.add_argument("--out", help="write the result as JSON")
+    p.add_argument("--compare", help="baseline JSON to compare against")
+    p.add_argument("--tolerance", type=float, default=0.25, help="allowed regression vs baseline")
+    p.add_argument("--keep", action="store_true", help="keep the temp data dir")
+    args = p.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix="checkin-bench-")
+    names = synthetic_names(args.guests)
+    write_guest_csv(Path(data_dir) / "guests.csv", names)
+    os.environ["CHECKIN_DATA_DIR"] = data_dir
+    os.environ["ADMIN_KEY"] = ADMIN_KEY
+    os.environ.pop("CHECKIN_DB", None)
+    os.environ.pop("GUESTS_CSV", None)
+    if not args.uvicorn:
+        os.chdir(BASE_DIR)
+        sys.path.insert(0, str(BASE_DIR))
+
+    runner = run_uvicorn if args.uvicorn else run_in_process
+    rec, elapsed, startup, before = asyncio.run(runner(args, names))
+
+    checkins = sum(len(v) for k, v in rec.samples.items() if k.startswith("checkin:"))
+    result = {
+        "meta": {
+            "guests": args.guests,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "admin_concurrency": args.admin_concurrency,
+            "mix": {"hit": args.hit, "partial": args.partial, "miss": args.miss},
+            "mode": "uvicorn" if args.uvicorn else "asgi",
+            "env": {k: v for k, v in os.environ.items() if k.startswith("CHECKIN_") and k != "CHECKIN_DATA_DIR"},
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()} cpus={os.cpu_count()}",
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "startup_s": round(startup, 3),
+        "elapsed_s": round(elapsed, 3),
+        "checkin_rps": round(checkins / elapsed, 1) if elapsed else 0,
+        "db_bytes_before": before,
+        "db_bytes_after": db_size(data_dir),
+        "ops": summarize(rec.samples, rec.errors, elapsed),
+    }
+    print_report(result)
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    if not args.keep:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    else:
+        print(f"data dir kept: {data_dir}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print("REGRESSION: " + ", ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
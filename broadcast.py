@@ -0,0 +1,94 @@
+# ============================================================
+# broadcast.py — In-process event hub for the admin live feed
+# ============================================================
+#
+# checkin_log (หลัง commit) และ guest CRUD handlers เรียก publish()
+# dashboard ที่เปิดอยู่รับผ่าน /api/admin/stream (Server-Sent Events)
+# - ทุก event มี id ต่อเนื่อง; เก็บ event ล่าสุดไว้ให้ client ต่อจาก Last-Event-ID
+# - client แต่ละตัวมีคิวจำกัดขนาด ถ้าตามไม่ทันจะได้ event "reset" ให้โหลดใหม่ทั้งหมด
+#   (client ช้าตัวเดียวจึงไม่กินหน่วยความจำหรือถ่วงคนอื่น)
+
+import asyncio
+import json
+import threading
+from collections import deque
+
+REPLAY_SIZE = 1000
+CLIENT_BUFFER = 256
+
+
+class Hub:
+    def __init__(self, replay_size=REPLAY_SIZE, client_buffer=CLIENT_BUFFER):
+        self.client_buffer = client_buffer
+        self._seq = 0
+        self._recent = deque(maxlen=replay_size)    # (id, type, data)
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._loop = None
+
+    @property
+    def last_id(self):
+        return self._seq
+
+    # -----------------------------
+    # Publishing (เรียกได้จากทุก thread)
+    # -----------------------------
+    def publish(self, type_, data):
+        with self._lock:
+            self._seq += 1
+            event = (self._seq, type_, data)
+            self._recent.append(event)
+            # schedule ภายใต้ lock: ลำดับที่ส่งให้ client ตรงกับลำดับ id
+            if self._loop is not None and self._clients:
+                self._loop.call_soon_threadsafe(self._fanout, event)
+
+    def _fanout(self, event):
+        for q in list(self._clients):
+            try:
+                q.put_nowait(event)
+            except asyncio.QueueFull:
+                # ตามไม่ทัน: ทิ้งที่ค้างแล้วบอกให้ client โหลดข้อมูลใหม่ทั้งหมด
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait((event[0], "reset", {}))
+
+    # -----------------------------
+    # Subscribing (ใน event loop)
+    # -----------------------------
+    def subscribe(self, last_event_id=None):
+        """
+        Register a client; returns ``(queue, backlog)``.
+
+        backlog = event ที่ client พลาดไปหลัง last_event_id หรือ [reset]
+        ถ้า id นั้นเก่าเกินกว่าที่เก็บไว้
+        """
+        q = asyncio.Queue(maxsize=self.client_buffer)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._clients.add(q)
+            backlog = []
+            if last_event_id is not None and last_event_id > self._seq:
+                # id จาก worker อื่น (แต่ละ process นับ id ของตัวเอง) หรือก่อน restart
+                backlog = [(self._seq, "reset", {})]
+            elif last_event_id is not None and last_event_id < self._seq:
+                oldest = self._recent[0][0] if self._recent else self._seq + 1
+                if last_event_id + 1 < oldest:
+                    backlog = [(self._seq, "reset", {})]
+                else:
+                    backlog = [e for e in self._recent if e[0] > last_event_id]
+        return q, backlog
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._clients.discard(q)
+
+    @property
+    def client_count(self):
+        return len(self._clients)
+
+
+def format_sse(event):
+    """One event as text/event-stream bytes."""
+    event_id, type_, data = event
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"id: {event_id}\nevent: {type_}\ndata: {payload}\n\n".encode("utf-8")
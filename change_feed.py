@@ -0,0 +1,120 @@
+# ============================================================
+# change_feed.py — Follow commits from every process sharing the DB file
+# ============================================================
+#
+# รันหลาย worker (uvicorn --workers N) แต่ละ process มี state ในหน่วยความจำของตัวเอง
+# (ตัวนับ stats, live feed ของ dashboard) จึงต้องรู้ว่า worker อื่นเขียนอะไรลง DB
+# - thread หนึ่งต่อ process ถือ connection ของตัวเองไว้ แล้วตรวจ PRAGMA data_version
+#   (เปลี่ยนทุกครั้งที่ connection อื่น commit ไม่ว่าจาก process ไหน) ถ้าไม่เปลี่ยนก็ไม่อ่านอะไรเลย
+# - checkins: อ่านต่อจาก id ล่าสุดที่เห็น (AUTOINCREMENT + writer ทีละคน = id เรียงตามลำดับ commit)
+#   แล้วส่งให้ on_checkins ทุกแถว รวมถึงแถวที่ process นี้เขียนเอง
+# - guests: เทียบ guest_meta.version (trigger เพิ่มค่าทุกครั้งที่แก้) แล้วเรียก on_guest_version
+#
+# การเขียนใน process เดียวกันเรียก wake() หลัง commit จึงไม่ต้องรอรอบ poll
+
+import logging
+import os
+import threading
+
+from guest_store import read_guest_version
+
+log = logging.getLogger(__name__)
+
+POLL_INTERVAL = int(os.getenv("CHECKIN_FEED_POLL_MS", "250")) / 1000
+BATCH_SIZE = 500
+
+SELECT_CHECKINS = (
+    "SELECT id, name, seat, seat_en, user_agent, ip, created_at FROM checkins "
+    "WHERE id > ? ORDER BY id LIMIT ?"
+)
+
+
+class ChangeFeed:
+    def __init__(self, connect, interval=POLL_INTERVAL, batch_size=BATCH_SIZE):
+        self._connect = connect
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self.on_checkins = []       # callback(rows) — list ของ dict แถว log เรียงตาม id
+        self.on_guest_version = []  # callback(version) — เมื่อ guest_meta.version เปลี่ยน
+        self.last_id = 0
+        self.guest_version = None
+
+        self._conn = None
+        self._data_version = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # -----------------------------
+    # Lifecycle
+    # -----------------------------
+    def start(self, last_id=0, guest_version=None):
+        """Follow changes committed after checkins.id ``last_id`` / guests ``guest_version``."""
+        if self._thread is not None:
+            return
+        self.last_id = last_id
+        self.guest_version = guest_version
+        self._conn = self._connect()
+        self._data_version = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        self._conn.close()
+        self._conn = None
+
+    def wake(self, *_):
+        """Poll now instead of at the next interval (e.g. right after a local commit)."""
+        self._wake.set()
+
+    # -----------------------------
+    # Polling
+    # -----------------------------
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.poll()
+            except Exception:
+                # DB ถูก lock นาน ฯลฯ: รอบถัดไปลองใหม่ (last_id ยังไม่ขยับ ไม่มีแถวหาย)
+                log.exception("change feed poll failed")
+
+    def poll(self):
+        conn = self._conn
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+
+        while True:
+            rows = conn.execute(SELECT_CHECKINS, (self.last_id, self.batch_size)).fetchall()
+            if rows:
+                batch = [dict(r) for r in rows]
+                self._dispatch(self.on_checkins, batch)
+                self.last_id = batch[-1]["id"]
+            if len(rows) < self.batch_size:
+                break
+
+        version = read_guest_version(conn)
+        if version != self.guest_version:
+            self.guest_version = version
+            self._dispatch(self.on_guest_version, version)
+
+    @staticmethod
+    def _dispatch(callbacks, arg):
+        for callback in callbacks:
+            try:
+                callback(arg)
+            except Exception:
+                log.exception("change feed callback failed")
@@ -0,0 +1,342 @@
+# ============================================================
+# checkin_log.py — Check-in log writes (direct or write-behind)
+# ============================================================
+#
+# ทุก /checkin ต้องเขียน 1 แถวลง checkins (+ upsert guest_checkins ถ้าพบชื่อ)
+# - direct (ค่าเริ่มต้น): เขียนและ commit ทันทีต่อคำขอ เหมือนเดิม
+# - write-behind (CHECKIN_WRITE_BEHIND=1): ใส่คิวในหน่วยความจำ แล้ว thread
+#   เบื้องหลังรวบเป็น transaction ละหลายแถว (ครบ batch หรือครบเวลา) = fsync
+#   ครั้งเดียวต่อกลุ่ม แทนหนึ่งครั้งต่อแขก
+#
+# หลาย worker: direct ตอบ "already" ถูกเสมอ (upsert + อ่านใน transaction เดียว)
+# write-behind ถือจำนวนครั้งไว้ต่อ process ถ้าไม่เคยเห็นแขกคนนี้จะถาม guest_checkins ก่อน
+# (แถวที่ยังค้างคิวของ worker อื่นมองไม่เห็น จนกว่าจะ commit)
+#
+# durability ของ write-behind:
+# - "buffered": ตอบที่นั่งทันที แถว log อาจหายได้ไม่เกิน ~1 batch ถ้า process ตาย
+# - "group":    รอจน batch ที่มีแถวนี้ commit แล้วค่อยตอบ (ยังได้ group commit)
+#
+# batch ที่เขียนไม่ได้: DB lock ลองใหม่แบบ backoff ไม่เกิน WRITE_RETRIES รอบ, error อื่นไม่ลองซ้ำ
+# แล้วจดแถวลง dead-letter (JSONL) + log, Future ที่รออยู่ (group / flush) ได้ exception แทนการค้าง
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from db import DatabaseBusy, is_busy_error, retry_busy
+from metrics import timed
+
+log = logging.getLogger(__name__)
+
+WRITE_BEHIND = os.getenv("CHECKIN_WRITE_BEHIND", "0") == "1"
+BATCH_SIZE = int(os.getenv("CHECKIN_WRITE_BATCH", "200"))
+MAX_DELAY = int(os.getenv("CHECKIN_WRITE_DELAY_MS", "50")) / 1000
+DURABILITY = os.getenv("CHECKIN_WRITE_DURABILITY", "buffered")
+# รอบ retry ของ batch ที่ชน lock (backoff 0.05s เพิ่มเท่าตัว สูงสุด 2s ต่อรอบ ~15s รวม)
+WRITE_RETRIES = int(os.getenv("CHECKIN_WRITE_RETRIES", "10"))
+
+INSERT_LOG = (
+    "INSERT INTO checkins (name, seat, seat_en, user_agent, ip, created_at) "
+    "VALUES (?,?,?,?,?,?)"
+)
+LOG_COLUMNS = ("id", "name", "seat", "seat_en", "user_agent", "ip", "created_at")
+# MIN/MAX: เช็คอินจาก kiosk ที่ offline อาจมาถึงช้ากว่าเวลาที่เกิดจริง
+UPSERT_STATE = """
+    INSERT INTO guest_checkins(name_key, first_checkin_at, last_seen_at, checkin_count)
+    VALUES (?,?,?,1)
+    ON CONFLICT(name_key) DO UPDATE SET
+        first_checkin_at = MIN(first_checkin_at, excluded.first_checkin_at),
+        last_seen_at     = MAX(last_seen_at, excluded.last_seen_at),
+        checkin_count    = checkin_count + 1
+"""
+SELECT_COUNT = "SELECT checkin_count FROM guest_checkins WHERE name_key=?"
+
+_FLUSH = "flush"
+_STOP = "stop"
+
+
+class CheckinLog:
+    """Records check-in attempts; see module comment for the two modes."""
+
+    def __init__(self, get_conn, write_behind=WRITE_BEHIND, batch_size=BATCH_SIZE,
+                 max_delay=MAX_DELAY, durability=DURABILITY, dead_letter=None):
+        if durability not in ("buffered", "group"):
+            raise ValueError("durability must be 'buffered' or 'group'")
+        self._get_conn = get_conn
+        self.write_behind = write_behind
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.durability = durability
+        self.dead_letter = dead_letter  # path ของ JSONL สำหรับแถวที่เขียนไม่สำเร็จ (None = log อย่างเดียว)
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._counts = {}               # name_key -> checkin_count (เฉพาะ write-behind)
+        self._counts_lock = threading.Lock()
+        # เรียกหลัง commit ด้วย list ของแถว log (dict พร้อม id) เช่นปลุก ChangeFeed
+        self.on_commit = None
+
+    # -----------------------------
+    # Lifecycle
+    # -----------------------------
+    def start(self):
+        if not self.write_behind or self._thread is not None:
+            return
+        # "already" ต้องตอบได้ก่อนแถวจะถึง DB จึงถือจำนวนครั้งไว้ในหน่วยความจำ
+        with self._get_conn() as conn:
+            rows = conn.execute("SELECT name_key, checkin_count FROM guest_checkins").fetchall()
+        self._counts = {r["name_key"]: r["checkin_count"] for r in rows}
+        self._thread = threading.Thread(target=self._run, name="checkin-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Drain everything still queued, then stop the writer thread."""
+        if self._thread is None:
+            return
+        done = Future()
+        self._queue.put((_STOP, done))
+        done.result()
+        self._thread.join()
+        self._thread = None
+
+    def flush(self):
+        """Block until every row queued so far is committed."""
+        if self._thread is None:
+            return
+        done = Future()
+        self._queue.put((_FLUSH, done))
+        done.result()
+
+    # -----------------------------
+    # Recording
+    # -----------------------------
+    @timed("checkin_log.record_miss")
+    def record_miss(self, name, ua, ip, created_at):
+        """
+        Log an attempt that did not resolve to a guest.
+
+        คืน Future ถ้าผู้เรียกต้องรอ commit (write-behind + durability "group")
+        """
+        row = (name, None, None, ua, ip, created_at)
+        if not self.write_behind:
+            row_id = self._insert_miss(row)
+            self._notify([(row_id, *row)])
+            return None
+        return self._enqueue(row, None)
+
+    @retry_busy
+    def _insert_miss(self, row):
+        with self._get_conn() as conn:
+            row_id = conn.execute(INSERT_LOG, row).lastrowid
+            conn.commit()
+        return row_id
+
+    @timed("checkin_log.record_checkin")
+    def record_checkin(self, name_key, name, seat, seat_en, ua, ip, created_at):
+        """
+        Log a successful check-in and bump the per-guest state.
+
+        คืน ``(already, pending)`` — pending เป็น Future หรือ None เหมือน record_miss
+        """
+        row = (name, seat, seat_en, ua, ip, created_at)
+        if not self.write_behind:
+            row_id, count = self._insert_checkin(name_key, row, created_at)
+            self._notify([(row_id, *row)])
+            return count > 1, None
+
+        with self._counts_lock:
+            known = self._counts.get(name_key)
+        if known is None:
+            # ไม่เคยเห็นใน process นี้: worker อื่นอาจเช็คอินแขกคนนี้ไปแล้ว (PK lookup ครั้งเดียวต่อแขก)
+            with self._get_conn() as conn:
+                stored = conn.execute(SELECT_COUNT, (name_key,)).fetchone()
+            known = stored["checkin_count"] if stored else 0
+        with self._counts_lock:
+            count = max(self._counts.get(name_key, 0), known) + 1
+            self._counts[name_key] = count
+        return count > 1, self._enqueue(row, (name_key, created_at, created_at))
+
+    @retry_busy
+    def _insert_checkin(self, name_key, row, created_at):
+        # upsert ก่อนแล้วค่อยอ่าน checkin_count ใน transaction เดียวกับการเขียน log
+        # สองคำขอพร้อมกันจึงไม่ได้ already=False ทั้งคู่
+        with self._get_conn() as conn:
+            row_id = conn.execute(INSERT_LOG, row).lastrowid
+            conn.execute(UPSERT_STATE, (name_key, created_at, created_at))
+            count = conn.execute(SELECT_COUNT, (name_key,)).fetchone()["checkin_count"]
+            conn.commit()
+        return row_id, count
+
+    @timed("checkin_log.record_batch")
+    def record_batch(self, kiosk_id, entries):
+        """
+        Log check-ins uploaded by a kiosk in one transaction, idempotently.
+
+        ``entries`` = ``[(idempotency_key, name_key or None, row), ...]`` (row แบบ record_*)
+        คืน dict ต่อรายการ ``{"checkin_id", "name_key", "already", "replayed"}``
+        key ที่ kiosk เดียวกันเคยส่งแล้วได้ผลครั้งแรกกลับไป (replayed=True) โดยไม่เขียนซ้ำ
+        """
+        # write-behind: ให้แถวที่ค้างคิวลง guest_checkins ก่อน "already" จะได้ถูก
+        self.flush()
+        results, committed, counts = self._insert_batch(kiosk_id, entries)
+        if self.write_behind:
+            with self._counts_lock:
+                for name_key, count in counts.items():
+                    self._counts[name_key] = max(self._counts.get(name_key, 0), count)
+        self._notify(committed)
+        return results
+
+    @retry_busy
+    def _insert_batch(self, kiosk_id, entries):
+        results, committed, counts = [], [], {}
+        with self._get_conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for idem, name_key, row in entries:
+                prev = conn.execute(
+                    "SELECT checkin_id, name_key, already FROM kiosk_checkins "
+                    "WHERE kiosk_id=? AND idempotency_key=?",
+                    (kiosk_id, idem),
+                ).fetchone()
+                if prev is not None:
+                    results.append({
+                        "checkin_id": prev["checkin_id"], "name_key": prev["name_key"],
+                        "already": bool(prev["already"]), "replayed": True,
+                    })
+                    continue
+                row_id = conn.execute(INSERT_LOG, row).lastrowid
+                already = False
+                if name_key is not None:
+                    created_at = row[-1]
+                    conn.execute(UPSERT_STATE, (name_key, created_at, created_at))
+                    counts[name_key] = conn.execute(SELECT_COUNT, (name_key,)).fetchone()["checkin_count"]
+                    already = counts[name_key] > 1
+                conn.execute(
+                    "INSERT INTO kiosk_checkins(kiosk_id, idempotency_key, checkin_id, name_key, already) "
+                    "VALUES (?,?,?,?,?)",
+                    (kiosk_id, idem, row_id, name_key, int(already)),
+                )
+                results.append({"checkin_id": row_id, "name_key": name_key, "already": already, "replayed": False})
+                committed.append((row_id, *row))
+            conn.commit()
+        return results, committed, counts
+
+    def rename(self, old_key, new_key):
+        """Follow an admin rename (DB row is moved by the caller)."""
+        if not self.write_behind:
+            return
+        with self._counts_lock:
+            if old_key in self._counts:
+                self._counts[new_key] = self._counts.pop(old_key)
+
+    def _enqueue(self, row, state):
+        if self._thread is None:
+            raise RuntimeError("write-behind log is not running")
+        pending = Future() if self.durability == "group" else None
+        self._queue.put((row, state, pending))
+        return pending
+
+    # -----------------------------
+    # Writer thread
+    # -----------------------------
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size and batch[-1][0] not in (_FLUSH, _STOP):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            self._write(batch)
+            if any(item[0] == _STOP for item in batch):
+                return
+
+    def _write(self, batch):
+        rows, keys, states, waiters, stops = [], [], [], [], []
+        for item in batch:
+            if item[0] == _FLUSH:
+                waiters.append(item[1])
+                continue
+            if item[0] == _STOP:
+                stops.append(item[1])
+                continue
+            row, state, pending = item
+            rows.append(row)
+            keys.append(state[0] if state is not None else None)
+            if state is not None:
+                states.append(state)
+            if pending is not None:
+                waiters.append(pending)
+
+        delay = 0.05
+        committed, error = [], None
+        for attempt in range(WRITE_RETRIES + 1):
+            if not rows:
+                break
+            try:
+                with self._get_conn() as conn:
+                    # execute ทีละแถว (ยัง commit ครั้งเดียว) เพื่อได้ id ของแต่ละแถว
+                    ids = [conn.execute(INSERT_LOG, row).lastrowid for row in rows]
+                    conn.executemany(UPSERT_STATE, states)
+                    conn.commit()
+                committed = [(row_id, *row) for row_id, row in zip(ids, rows)]
+                break
+            except Exception as exc:
+                if not is_busy_error(exc):
+                    error = exc
+                    break
+                if attempt == WRITE_RETRIES:
+                    error = DatabaseBusy("checkin_log.write")
+                    error.__cause__ = exc
+                    break
+                log.warning("check-in log batch of %d rows hit a locked DB; retrying", len(rows))
+                time.sleep(delay)
+                delay = min(delay * 2, 2.0)
+
+        if error is not None:
+            self._drop(rows, keys, states, error)
+        self._notify(committed)
+        for fut in waiters:
+            if error is None:
+                fut.set_result(None)
+            else:
+                fut.set_exception(error)
+        # stop() ไม่ได้ exception: writer หยุดจริง shutdown ทำขั้นต่อไปได้ (แถวที่ตกอยู่ใน dead-letter แล้ว)
+        for fut in stops:
+            fut.set_result(None)
+
+    def _drop(self, rows, keys, states, error):
+        """Give up on a batch: dead-letter the rows and undo their in-memory counts."""
+        log.error("check-in log batch of %d rows dropped", len(rows), exc_info=error)
+        with self._counts_lock:
+            for name_key, _, _ in states:
+                count = self._counts.get(name_key, 0) - 1
+                if count > 0:
+                    self._counts[name_key] = count
+                else:
+                    self._counts.pop(name_key, None)
+        if self.dead_letter is None:
+            return
+        try:
+            with open(self.dead_letter, "a", encoding="utf-8") as f:
+                for row, key in zip(rows, keys):
+                    record = dict(zip(LOG_COLUMNS[1:], row), name_key=key, error=repr(error))
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError:
+            log.exception("could not write check-in dead-letter file %s", self.dead_letter)
+
+    def _notify(self, rows):
+        if not rows or self.on_commit is None:
+            return
+        try:
+            self.on_commit([dict(zip(LOG_COLUMNS, r)) for r in rows])
+        except Exception:
+            log.exception("check-in on_commit callback failed")
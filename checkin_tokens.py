@@ -0,0 +1,41 @@
+# ============================================================
+# checkin_tokens.py — Per-guest check-in tokens (QR codes)
+# ============================================================
+#
+# แขกแต่ละคนมี token สุ่ม (เดาไม่ได้, คงเดิมแม้เปลี่ยนชื่อ/ที่นั่ง) เก็บใน guests.checkin_token
+# ที่มี unique index: สแกน QR = หาแถวด้วย index ครั้งเดียว ไม่ต้องค้นชื่อบางส่วน
+# - สร้างแบบ bulk ให้ทุกแถวที่ยังไม่มี (ตอน init_db, หลัง import, qr_batch.py)
+# - ส่งออกไปกับ guests.csv / export (seed จาก guests.csv จะได้ token เดิมกลับมา
+#   QR ที่พิมพ์แจกไปแล้วจึงยังใช้ได้หลังสร้าง DB ใหม่)
+
+import re
+import secrets
+
+TOKEN_BYTES = 16        # token_urlsafe -> 22 ตัวอักษร (128 bit)
+TOKEN_PATTERN = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+
+def new_token():
+    return secrets.token_urlsafe(TOKEN_BYTES)
+
+
+def is_token(value):
+    return bool(value) and TOKEN_PATTERN.match(value) is not None
+
+
+def assign_missing_tokens(conn):
+    """Give every guest without a token a fresh one; returns how many. The caller commits."""
+    keys = [r[0] for r in conn.execute("SELECT name_key FROM guests WHERE checkin_token IS NULL")]
+    conn.executemany(
+        "UPDATE guests SET checkin_token=? WHERE name_key=?",
+        [(new_token(), k) for k in keys],
+    )
+    return len(keys)
+
+
+def find_guest(conn, token):
+    """Guest row for ``token`` (unique index lookup) or None."""
+    return conn.execute(
+        "SELECT name_key, display_name, seat, seat_en FROM guests WHERE checkin_token=?",
+        (token,),
+    ).fetchone()
@@ -1,5 +1,25 @@
-# db.py
-import sqlite3, os, pathlib
+# db.py — SQLite connection pool + schema/migrations (ใช้ร่วมกันทั้ง app.py และสคริปต์อื่น)
+import asyncio
+import csv
+import functools
+import os
+import pathlib
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from checkin_tokens import assign_missing_tokens, new_token
+from kiosk_sync import prune_changes
+from metrics import TimedConnection
+
+try:
+    import fcntl
+except ImportError:     # Windows: ไม่มี flock (ใช้ได้แค่ worker เดียว)
+    fcntl = None
 
 BASE_DIR = pathlib.Path(__file__).resolve().parent
 
@@ -13,23 +33,467 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 DB_FILE = pathlib.Path(os.getenv("CHECKIN_DB", DATA_DIR / "checkin.db"))
 DB_FILE.parent.mkdir(parents=True, exist_ok=True)
 
-def get_conn():
-    conn = sqlite3.connect(DB_FILE)
+# จำนวน connection สูงสุดที่เปิดค้างไว้ (threadpool ของ FastAPI ใหญ่กว่านี้ได้
+# คำขอที่เกินจะรอ connection ว่างแทนการเปิดใหม่)
+POOL_SIZE = int(os.getenv("CHECKIN_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.getenv("CHECKIN_DB_POOL_TIMEOUT", "30"))
+
+# ตั้งค่าครั้งเดียวตอนเปิด connection
+# - busy_timeout ก่อนอย่างอื่น: การสลับเป็น WAL เองก็ต้องรอ lock ถ้า worker อื่นเปิดอยู่
+# - WAL: ผู้อ่านไม่บล็อกผู้เขียน (และกลับกัน) ช่วงคนเช็คอินพร้อมกัน
+# - synchronous=NORMAL: ใน WAL ยังปลอดภัยต่อไฟล์เสีย เสียแค่ transaction ล่าสุดถ้าไฟดับ
+BUSY_TIMEOUT_MS = int(os.getenv("CHECKIN_DB_BUSY_TIMEOUT_MS", "5000"))
+PRAGMAS = (
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+# statement cache ต่อ connection (sqlite3 จะ reuse prepared statement ที่ SQL ตรงกัน)
+CACHED_STATEMENTS = 256
+
+
+def connect(path=None):
+    """Open one configured connection (Row factory, WAL, pragmas)."""
+    conn = sqlite3.connect(
+        path or DB_FILE,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
+        factory=TimedConnection,        # จับเวลาทุก statement (ดู /metrics)
+    )
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def init_db():
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("""
+
+class ConnectionPool:
+    """
+    Bounded pool of long-lived connections.
+
+    เรียก get_conn() ซ้อนกันใน thread เดียวจะได้ connection เดิม
+    (ไม่กิน slot เพิ่ม และเห็น transaction เดียวกัน)
+    """
+
+    def __init__(self, path=None, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return connect(self.path)
+                except Exception:
+                    self._opened -= 1
+                    raise
+        return self._idle.get(timeout=self.timeout)
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._opened -= 1
+
+
+pool = ConnectionPool()
+
+
+def get_conn():
+    """``with get_conn() as conn:`` — borrow a pooled connection."""
+    return pool.connection()
+
+
+def close_pool():
+    pool.close()
+
+
+# -----------------------------
+# Running DB work off the event loop
+# -----------------------------
+# งาน SQLite ทั้งหมดวิ่งบน executor ขนาดเท่า pool (thread ไม่ต้องรอ connection)
+# แต่ละ "lane" จำกัดงานที่ทำพร้อมกัน + จำนวนที่รอคิว เกินนั้นตอบ 503 ทันที
+# (backpressure) แทนการกองคำขอไว้จน timeout ทั้งหมด
+MAX_QUEUE = int(os.getenv("CHECKIN_DB_MAX_QUEUE", "256"))
+
+executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="db")
+
+
+class DatabaseBusy(Exception):
+    """Too many requests are already waiting for the database."""
+
+
+class Lane:
+    def __init__(self, name, limit, max_queue=MAX_QUEUE):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.running = 0
+        self._sem = None
+        self._loop = None
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._sem = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._sem
+
+    async def run(self, fn, *args, **kwargs):
+        sem = self._semaphore()
+        if sem.locked() and self.waiting >= self.max_queue:
+            raise DatabaseBusy(self.name)
+        self.waiting += 1
+        try:
+            await sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            call = functools.partial(fn, *args, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(executor, call)
+        finally:
+            self.running -= 1
+            sem.release()
+
+
+# check-in ได้เต็ม pool, admin ได้ส่วนเล็ก ๆ จะได้ไม่แย่งหน้างานตอนคนเข้าแถว
+# kiosk (snapshot รายชื่อ / upload ที่คิวไว้) ก็ได้ส่วนเล็ก ๆ เหมือนกัน
+lanes = {
+    "checkin": Lane("checkin", POOL_SIZE),
+    "admin": Lane("admin", max(1, POOL_SIZE // 4)),
+    "kiosk": Lane("kiosk", max(1, POOL_SIZE // 4)),
+}
+
+
+async def run_db(fn, *args, lane="checkin", **kwargs):
+    """Run blocking ``fn`` on the DB executor under ``lane``'s limits."""
+    return await lanes[lane].run(fn, *args, **kwargs)
+
+
+def offload(lane):
+    """
+    Turn a sync route handler into an async one that runs via run_db().
+
+    FastAPI อ่าน signature ผ่าน __wrapped__ จึงยังได้ Body/Path parameters เดิม
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await run_db(fn, *args, lane=lane, **kwargs)
+        return wrapper
+    return decorator
+
+
+# -----------------------------
+# Lock contention between processes (uvicorn --workers N)
+# -----------------------------
+# busy_timeout รอ lock ให้อยู่แล้ว แต่ SQLite ตอบ "database is locked" ทันทีได้
+# (เช่น transaction ที่อ่านก่อนแล้วค่อยเขียน ชนกับ worker อื่น) และรอเกิน timeout
+# ได้ช่วงโหลดหนัก retry_busy จึงลองทั้งฟังก์ชันใหม่แบบ backoff แล้วค่อยตอบ 503
+WRITE_RETRIES = int(os.getenv("CHECKIN_DB_WRITE_RETRIES", "5"))
+RETRY_BASE_DELAY = 0.02
+
+
+def is_busy_error(exc):
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    msg = str(exc).lower()
+    return "locked" in msg or "busy" in msg
+
+
+def retry_busy(fn):
+    """
+    Retry ``fn`` when SQLite reports a lock conflict; DatabaseBusy once retries run out.
+
+    ใช้กับฟังก์ชันชั้นนอกสุดที่เปิด/commit transaction เอง (ทุกครั้งที่ลองใหม่
+    connection ถูกคืน pool และ rollback แล้ว จึงเริ่มจากสถานะสะอาด)
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                return fn(*args, **kwargs)
+            except sqlite3.OperationalError as exc:
+                if not is_busy_error(exc):
+                    raise
+                if attempt == WRITE_RETRIES:
+                    raise DatabaseBusy(fn.__name__) from exc
+            # jitter: worker ที่ชนกันจะได้ไม่ลองใหม่พร้อมกันอีก
+            time.sleep(RETRY_BASE_DELAY * (2 ** attempt) * (0.5 + random.random()))
+    return wrapper
+
+
+# -----------------------------
+# Schema / migrations (จุดเดียวสำหรับทุกไฟล์)
+# -----------------------------
+# เพิ่มค่านี้ทุกครั้งที่แก้ _migrate() (เก็บใน PRAGMA user_version ของไฟล์ DB)
+SCHEMA_VERSION = 4
+INIT_LOCK_FILE = DB_FILE.with_name(DB_FILE.name + ".init.lock")
+
+
+@contextmanager
+def init_lock():
+    """
+    Exclusive file lock around startup work.
+
+    ทุก worker เรียก init_db() ตอน startup พร้อมกัน: ตัวแรกทำ migration/seed
+    ตัวที่เหลือรอ แล้วเห็นว่า user_version ใหม่แล้วจึงข้ามไป
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(INIT_LOCK_FILE, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def init_db(guest_csv_path=None):
+    """Migrate the schema (once per DB file) and seed guests from CSV if the table is empty."""
+    with init_lock(), get_conn() as conn:
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            _migrate(conn)
+            conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        _seed_guests(conn, guest_csv_path)
+        # แถวที่เพิ่มจากภายนอก (sqlite3 CLI ฯลฯ) ก็ได้ token ตอน start ครั้งถัดไป
+        assign_missing_tokens(conn)
+        # change log โตตาม trigger ตลอด (seed, แก้ผ่าน CLI ...) ตัดให้เหลือ KEEP_CHANGES แถว
+        prune_changes(conn)
+        conn.commit()
+
+
+def _migrate(conn):
+    # tables เดิมของคุณ…
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS checkins (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            seat TEXT,
-            seat_en TEXT,
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            name       TEXT,
+            seat       TEXT,
+            seat_en    TEXT,
             user_agent TEXT,
-            ip TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
+            ip         TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS guests (
+            name_key TEXT PRIMARY KEY,
+            seat     TEXT,
+            seat_en  TEXT
+        )
+    """)
+    # version ของรายชื่อ: trigger เพิ่มค่าทุกครั้งที่ guests เปลี่ยน
+    # ใช้ให้ GuestStore รู้ว่า cache ในหน่วยความจำยังตรงกับ DB หรือไม่
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS guest_meta (
+            id      INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO guest_meta(id, version) VALUES (1, 0)")
+    # change log: trigger เดียวกันจด name_key ที่เปลี่ยนพร้อม version ใหม่
+    # (kiosk ขอเฉพาะส่วนที่เปลี่ยนตั้งแต่ version ที่ตัวเองมี ดู kiosk_sync.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS guest_changes (
+            id       INTEGER PRIMARY KEY AUTOINCREMENT,
+            version  INTEGER NOT NULL,
+            name_key TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_guest_changes_version ON guest_changes(version)")
+    changed_keys = {"INSERT": ("NEW",), "UPDATE": ("OLD", "NEW"), "DELETE": ("OLD",)}
+    for op, refs in changed_keys.items():
+        log_keys = "".join(
+            f"INSERT INTO guest_changes(version, name_key) "
+            f"SELECT version, {ref}.name_key FROM guest_meta WHERE id = 1;\n"
+            for ref in refs
+        )
+        # สร้างใหม่ทุกครั้งที่ migrate (trigger เดิมไม่มีส่วน change log)
+        conn.execute(f"DROP TRIGGER IF EXISTS guests_version_{op.lower()}")
+        conn.execute(f"""
+            CREATE TRIGGER guests_version_{op.lower()}
+            AFTER {op} ON guests
+            BEGIN
+                UPDATE guest_meta SET version = version + 1 WHERE id = 1;
+                {log_keys}
+            END
         """)
+    conn.commit()
+
+    # --- เพิ่มคอลัมน์ display_name ถ้ายังไม่มี ---
+    cols = conn.execute("PRAGMA table_info(guests)").fetchall()
+    has_display = any(c["name"] == "display_name" for c in cols)
+    if not has_display:
+        conn.execute("ALTER TABLE guests ADD COLUMN display_name TEXT")
         conn.commit()
+
+    # --- token สำหรับเช็คอินด้วย QR (ดู checkin_tokens.py) ---
+    if not any(c["name"] == "checkin_token" for c in cols):
+        conn.execute("ALTER TABLE guests ADD COLUMN checkin_token TEXT")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_guests_token ON guests(checkin_token)")
+    conn.commit()
+
+    # --- สถานะเช็คอินต่อแขก 1 แถว (แทนการค้น log checkins ทั้งตาราง) ---
+    has_state = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='guest_checkins'"
+    ).fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS guest_checkins (
+            name_key         TEXT PRIMARY KEY,
+            first_checkin_at DATETIME NOT NULL,
+            last_seen_at     DATETIME NOT NULL,
+            checkin_count    INTEGER NOT NULL DEFAULT 1
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_checkins_name_seat ON checkins(name, seat)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_checkins_created ON checkins(created_at, id)")
+    # ตัวกรอง seat / สถานะ (seat IS NULL = ไม่พบชื่อ) ของหน้า admin เรียงตาม id
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_checkins_seat ON checkins(seat, id)")
+    _create_checkins_fts(conn)
+    # เช็คอินที่ kiosk ส่งมาทีหลัง (offline): (kiosk, idempotency key) -> ผลครั้งแรก
+    # kiosk ส่ง batch ซ้ำ (เน็ตหลุดก่อนได้คำตอบ) จะได้ผลเดิมโดยไม่ลง log ซ้ำ
+    # key ไม่ซ้ำเฉพาะภายใน kiosk เดียว: สองเครื่องใช้ key เดียวกันได้
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS kiosk_checkins (
+            kiosk_id        TEXT NOT NULL,
+            idempotency_key TEXT NOT NULL,
+            checkin_id      INTEGER NOT NULL,
+            name_key        TEXT,
+            already         INTEGER NOT NULL DEFAULT 0,
+            received_at     DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (kiosk_id, idempotency_key)
+        )
+    """)
+    if not has_state:
+        # ย้ายประวัติเดิมจาก log (เฉพาะแถวที่เช็คอินสำเร็จ = มี seat)
+        state = {}
+        rows = conn.execute("""
+            SELECT name, MIN(created_at) AS first, MAX(created_at) AS last, COUNT(*) AS n
+            FROM checkins WHERE seat IS NOT NULL GROUP BY name
+        """).fetchall()
+        for r in rows:
+            k = (r["name"] or "").strip().lower()
+            if not k:
+                continue
+            first, last, n = state.get(k, (r["first"], r["last"], 0))
+            state[k] = (min(first, r["first"]), max(last, r["last"]), n + r["n"])
+        conn.executemany(
+            "INSERT INTO guest_checkins(name_key, first_checkin_at, last_seen_at, checkin_count) "
+            "VALUES (?,?,?,?)",
+            [(k, *v) for k, v in state.items()],
+        )
+    conn.commit()
+
+
+def _create_checkins_fts(conn):
+    """
+    Trigram index over checkins.name for the admin log's partial-name filter.
+
+    instr(lower(name), ?) อ่าน log ทั้งตาราง (หลักแสนแถวช่วงงาน) ทุกครั้งที่ค้น
+    external content: เก็บแค่ index ชื่อ อ่านแถวจริงจาก checkins ด้วย rowid = id
+    SQLite ที่ไม่มี fts5 / trigram (< 3.34) ข้ามไป ดู has_checkins_fts()
+    """
+    try:
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS checkins_fts
+            USING fts5(name, content='checkins', content_rowid='id', tokenize='trigram')
+        """)
+    except sqlite3.OperationalError:
+        return
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS checkins_fts_insert AFTER INSERT ON checkins
+        BEGIN
+            INSERT INTO checkins_fts(rowid, name) VALUES (NEW.id, NEW.name);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS checkins_fts_delete AFTER DELETE ON checkins
+        BEGIN
+            INSERT INTO checkins_fts(checkins_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS checkins_fts_update AFTER UPDATE OF name ON checkins
+        BEGIN
+            INSERT INTO checkins_fts(checkins_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+            INSERT INTO checkins_fts(rowid, name) VALUES (NEW.id, NEW.name);
+        END
+    """)
+    # log ที่มีอยู่ก่อน migration นี้
+    conn.execute("INSERT INTO checkins_fts(checkins_fts) VALUES ('rebuild')")
+
+
+def has_checkins_fts(conn):
+    """True if init_db() could create checkins_fts on this SQLite build."""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='checkins_fts'"
+    ).fetchone() is not None
+
+
+def _seed_guests(conn, guest_csv_path):
+    # ถ้าตาราง guests ยังว่าง ให้ import จาก CSV
+    count = conn.execute("SELECT COUNT(*) AS c FROM guests").fetchone()["c"]
+    if count == 0 and guest_csv_path:
+        try:
+            with open(guest_csv_path, encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                rows, tokens = [], set()
+                for r in reader:
+                    k = (r.get("name") or "").strip().lower()
+                    seat = (r.get("seat") or "").strip()
+                    seat_en = (r.get("seat_en") or "").strip()
+                    # token เดิมจาก guests.csv (QR ที่พิมพ์ไปแล้ว) ว่าง = สร้างใหม่ตอนนี้เลย
+                    # (ไม่ UPDATE ทีหลัง: trigger จะจด change log ซ้ำอีกแถวต่อแขก)
+                    token = (r.get("token") or "").strip()
+                    if not token or token in tokens:
+                        token = new_token()     # ซ้ำกันในไฟล์: INSERT OR IGNORE จะทิ้งทั้งแถว
+                    if k:
+                        rows.append((k, seat, seat_en, token))
+                        tokens.add(token)
+                if rows:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO guests(name_key, seat, seat_en, checkin_token) VALUES (?,?,?,?)",
+                        rows
+                    )
+                    conn.commit()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,121 @@
+# ============================================================
+# guest_import.py — Bulk guest import (validate in memory, apply once)
+# ============================================================
+#
+# รับ CSV หัวตาราง name,seat[,seat_en] (รูปแบบเดียวกับ guests.csv / ไฟล์ export)
+# 1) parse_guest_csv: อ่านทีละบรรทัด ตรวจชื่อ/ที่นั่ง เก็บ error พร้อมเลขบรรทัด
+# 2) plan_import:     เทียบกับรายชื่อปัจจุบัน หา conflict (ชื่อซ้ำ, ที่นั่งซ้ำ)
+# 3) apply_import:    เขียนทั้งหมดใน transaction เดียว
+#
+# mode: "upsert" = เพิ่ม/แก้ตามไฟล์ คนอื่นคงเดิม, "replace" = รายชื่อทั้งหมดตามไฟล์
+
+import csv
+
+from checkin_tokens import new_token
+
+MODES = ("upsert", "replace")
+MAX_ERRORS = 100
+
+
+def parse_guest_csv(lines, normalize_seat, seat_to_en):
+    """
+    Parse CSV lines into ``{name_key: (display_name, seat, seat_en)}``.
+
+    Returns ``(rows, errors)``; errors are ``{"line": n, "error": msg}``.
+    """
+    rows, errors = {}, []
+    seen_line = {}
+    reader = csv.DictReader(lines)
+    fields = [f.strip().lower() for f in (reader.fieldnames or [])]
+    if "name" not in fields or "seat" not in fields:
+        return rows, [{"line": 1, "error": "header must contain name,seat[,seat_en]"}]
+    reader.fieldnames = fields
+
+    for r in reader:
+        if len(errors) >= MAX_ERRORS:
+            break
+        line = reader.line_num
+        display_name = (r.get("name") or "").strip()
+        if not display_name and not (r.get("seat") or "").strip():
+            continue    # บรรทัดว่าง
+        name_key = display_name.lower()
+        if not name_key:
+            errors.append({"line": line, "error": "name is required"})
+            continue
+        try:
+            seat = normalize_seat(r.get("seat"))
+        except Exception as e:
+            errors.append({"line": line, "error": getattr(e, "detail", None) or str(e)})
+            continue
+        if name_key in rows:
+            errors.append({"line": line, "error": f"duplicate name (line {seen_line[name_key]})"})
+            continue
+        seat_en = (r.get("seat_en") or "").strip() or seat_to_en(seat)
+        rows[name_key] = (display_name, seat, seat_en)
+        seen_line[name_key] = line
+    return rows, errors
+
+
+def plan_import(existing, rows, mode):
+    """
+    Diff ``rows`` against ``existing`` (``{name_key: (display_name, seat, seat_en)}``).
+
+    คืน dict ที่มี added/updated/unchanged/removed และ conflicts ของที่นั่ง
+    (1 ที่นั่งต่อ 1 คน เหมือน POST /api/admin/guest)
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+
+    added, updated, unchanged = [], [], []
+    for k, v in rows.items():
+        old = existing.get(k)
+        if old is None:
+            added.append(k)
+        elif tuple(old) != v:
+            updated.append(k)
+        else:
+            unchanged.append(k)
+    removed = [k for k in existing if k not in rows] if mode == "replace" else []
+
+    # สถานะสุดท้ายหลัง import แล้วตรวจว่าที่นั่งไม่ชนกัน
+    final = dict(rows) if mode == "replace" else {**existing, **rows}
+    by_seat = {}
+    conflicts = []
+    for k, (_, seat, _) in final.items():
+        if not seat:
+            continue
+        other = by_seat.get(seat)
+        if other is None:
+            by_seat[seat] = k
+        elif k in rows or other in rows:
+            # ข้อมูลเดิมที่ชนกันเองอยู่แล้วไม่นับ (ไฟล์นี้ไม่ได้ทำให้เกิด)
+            conflicts.append({"seat": seat, "names": sorted([other, k])})
+
+    return {
+        "added": added,
+        "updated": updated,
+        "unchanged": unchanged,
+        "removed": removed,
+        "conflicts": conflicts[:MAX_ERRORS],
+    }
+
+
+def apply_import(conn, rows, plan, mode):
+    """Write a validated plan; the caller commits."""
+    if mode == "replace" and plan["removed"]:
+        conn.executemany(
+            "DELETE FROM guests WHERE name_key=?",
+            [(k,) for k in plan["removed"]],
+        )
+    changed = plan["added"] + plan["updated"]
+    conn.executemany(
+        """
+        INSERT INTO guests(name_key, display_name, seat, seat_en, checkin_token) VALUES (?,?,?,?,?)
+        ON CONFLICT(name_key) DO UPDATE SET
+            display_name = excluded.display_name,
+            seat         = excluded.seat,
+            seat_en      = excluded.seat_en
+        """,
+        # แขกใหม่ได้ token ใน INSERT เลย (แขกเดิมเก็บ token เดิม: ไม่อยู่ใน DO UPDATE)
+        [(k, *rows[k], new_token()) for k in changed],
+    )
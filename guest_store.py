@@ -0,0 +1,226 @@
+# ============================================================
+# guest_store.py — In-process guest list cache
+# ============================================================
+#
+# เก็บรายชื่อแขกทั้งหมดไว้ในหน่วยความจำ (สร้างครั้งเดียวตอน startup)
+# - admin endpoints อัปเดตแบบ incremental ผ่าน apply_change()
+# - ตรวจจับการแก้ไขจากภายนอก (sqlite3 CLI, process อื่น) ด้วย
+#   PRAGMA data_version + ตาราง guest_meta.version ที่ trigger คอยเพิ่มค่า
+#
+# Readers never take the lock: every change builds a new dict and swaps
+# the reference (copy-on-write), so a dict returned by snapshot() is
+# never mutated underneath the caller.
+
+import csv
+import threading
+import time
+from pathlib import Path
+
+from metrics import timed
+from name_index import NameIndex
+
+# ตรวจ data_version ได้ไม่เกินทุก ๆ กี่วินาที (lookup ส่วนใหญ่จึงไม่แตะ SQLite เลย)
+DEFAULT_CHECK_INTERVAL = 1.0
+
+
+def read_guest_version(conn) -> int:
+    """Current guests-table version (bumped by triggers on every write)."""
+    row = conn.execute("SELECT version FROM guest_meta WHERE id=1").fetchone()
+    return row[0] if row is not None else 0
+
+
+class LocalVersions:
+    """
+    Guests versions this process committed but has not applied to its cache yet.
+
+    handler จด version ไว้ก่อน commit (commit_guest_change ใน app.py) แล้วค่อย apply เอง
+    ระหว่างนั้น cache ที่เห็น version ใหม่จาก DB (change feed / data_version) ไม่ต้องโหลดใหม่ทั้งหมด
+    ใช้ทั้ง GuestStore และ AttendanceStats (คนละ instance: แต่ละตัว apply ถึง version ของตัวเอง)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = set()
+
+    def expect(self, *versions):
+        with self._lock:
+            self._versions.update(versions)
+
+    def forget(self, *versions):
+        """Undo expect() when the commit failed."""
+        with self._lock:
+            self._versions.difference_update(versions)
+
+    def applied(self, version):
+        """Drop everything up to ``version`` (now reflected in the cache)."""
+        with self._lock:
+            self._versions = {v for v in self._versions if v > version}
+
+    def covers(self, current, version):
+        """True if every version after ``current`` up to ``version`` was committed by this process."""
+        with self._lock:
+            return all(v in self._versions for v in range(current + 1, version + 1))
+
+
+class GuestStore:
+    """
+    Versioned in-memory copy of the ``guests`` table.
+
+    ``snapshot()`` returns ``{ name_key: {"seat", "seat_en", "display_name"} }``
+    — the same shape ``load_guests()`` always returned.
+    """
+
+    def __init__(self, connect, csv_path, check_interval: float = DEFAULT_CHECK_INTERVAL):
+        self._connect = connect     # factory จาก db.py (ตั้งค่า pragma เหมือน pool)
+        self.csv_path = Path(csv_path)
+        self.check_interval = check_interval
+
+        self.version = 0            # guest_meta.version ที่ cache นี้สะท้อนอยู่
+        self._guests = {}
+        self.index = NameIndex()    # partial-name index ของ key ใน _guests
+        self._from_csv = False      # True = ตาราง guests ว่าง กำลังใช้รายชื่อจาก CSV
+        self._lock = threading.Lock()
+        self.local_versions = LocalVersions()   # commit แล้วใน process นี้ รอ apply_change
+        self._watch_conn = None     # connection ค้างไว้สำหรับ PRAGMA data_version
+        self._data_version = None
+        self._next_check = 0.0
+
+    # -----------------------------
+    # Loading
+    # -----------------------------
+    def _watcher(self):
+        if self._watch_conn is None:
+            # connection แยกจาก pool: data_version เทียบได้เฉพาะใน connection เดิม
+            self._watch_conn = self._connect()
+        return self._watch_conn
+
+    def load(self):
+        """Full rebuild from the DB (fallback: guests.csv if the table is empty)."""
+        with self._lock:
+            self._reload_locked()
+
+    @timed("guest_store.reload")
+    def _reload_locked(self):
+        conn = self._watcher()
+        # อ่าน version ก่อนรายชื่อ: ถ้ามีคนแก้ระหว่างนี้ version จะเก่ากว่า
+        # ข้อมูลจริง และรอบตรวจถัดไปจะโหลดใหม่อีกครั้ง (ไม่มีทางค้างข้อมูลเก่า)
+        version = read_guest_version(conn)
+        rows = conn.execute(
+            "SELECT name_key, seat, seat_en, display_name FROM guests"
+        ).fetchall()
+
+        guests = {}
+        for name_key, seat, seat_en, display_name in rows:
+            guests[name_key] = {
+                "seat": seat,
+                "seat_en": seat_en,
+                "display_name": display_name or name_key,
+            }
+        self._from_csv = not guests
+        if self._from_csv:
+            guests = self._load_csv()
+
+        self._guests = guests
+        self.index = NameIndex(guests.keys())
+        self.version = version
+        self.local_versions.applied(version)
+        self._data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        self._next_check = time.monotonic() + self.check_interval
+
+    def _load_csv(self):
+        # fallback: CSV (เผื่อ DB ว่าง)
+        result = {}
+        try:
+            with open(self.csv_path, encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                for r in reader:
+                    k = (r.get("name") or "").strip().lower()
+                    if not k:
+                        continue
+                    result[k] = {
+                        "seat": (r.get("seat") or "").strip(),
+                        "seat_en": (r.get("seat_en") or "").strip(),
+                        "display_name": (r.get("name") or "").strip() or k,
+                    }
+        except FileNotFoundError:
+            pass
+        return result
+
+    # -----------------------------
+    # Out-of-band change detection
+    # -----------------------------
+    def refresh_if_stale(self, force=False):
+        """
+        Reload when another connection changed the guests table; True if it reloaded.
+
+        data_version เปลี่ยนทุกครั้งที่ connection อื่น commit (รวมถึง insert
+        checkins) จึงต้องเทียบ guest_meta.version ซ้ำก่อนตัดสินใจโหลดใหม่
+        force=True ตรวจทันทีไม่รอ check_interval (เช่น หาชื่อไม่เจอ อาจเพิ่งถูกเพิ่มที่ worker อื่น)
+        """
+        if not force and time.monotonic() < self._next_check:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if not force and now < self._next_check:
+                return False
+            self._next_check = now + self.check_interval
+            conn = self._watcher()
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return False
+            self._data_version = data_version
+            version = read_guest_version(conn)
+            # commit ของ handler ใน process นี้ที่ยังไม่ถึง apply_change: ไม่ต้องโหลดใหม่ทั้งหมด
+            if version != self.version and not self.local_versions.covers(self.version, version):
+                self._reload_locked()
+                return True
+            return False
+
+    # -----------------------------
+    # Reads
+    # -----------------------------
+    def snapshot(self):
+        """Current guest dict. Treat as read-only."""
+        self.refresh_if_stale()
+        return self._guests
+
+    def get(self, name_key):
+        return self.snapshot().get(name_key)
+
+    @timed("guest_store.search")
+    def search(self, query, limit=10):
+        """Ranked ``[(rank, name_key), ...]`` from the name index."""
+        self.refresh_if_stale()
+        guests = self._guests
+        return [(r, k) for r, k in self.index.search(query, limit) if k in guests]
+
+    # -----------------------------
+    # Incremental writes (called after the admin handlers commit)
+    # -----------------------------
+    def apply_change(self, version, upserts=None, deletes=()):
+        """
+        Apply one committed guests change.
+
+        ``version`` คือค่า guest_meta.version ที่อ่านภายใน transaction เดียวกับ
+        การเขียน ถ้า cache ตามไม่ทัน (มีการแก้จากภายนอกก่อนหน้า) ให้โหลดใหม่ทั้งหมด
+        """
+        with self._lock:
+            if self._from_csv or self.version not in (version, version - 1):
+                self._reload_locked()
+                return
+            guests = dict(self._guests)
+            for k in deletes:
+                guests.pop(k, None)
+                self.index.remove(k)
+            for k, v in (upserts or {}).items():
+                guests[k] = v
+                self.index.add(k)
+            self._guests = guests
+            self.version = version
+            self.local_versions.applied(version)
+
+    def close(self):
+        with self._lock:
+            if self._watch_conn is not None:
+                self._watch_conn.close()
+                self._watch_conn = None
@@ -0,0 +1,127 @@
+# ============================================================
+# kiosk_sync.py — Guest list sync + offline check-in upload for kiosks
+# ============================================================
+#
+# kiosk (แท็บเล็ตหน้างาน) เก็บรายชื่อไว้ในเครื่อง หา name -> ที่นั่งเองได้แม้ Wi-Fi หลุด
+# 1) snapshot:  รายชื่อทั้งหมด + version (guest_meta.version) แบบ array สั้น ๆ
+# 2) delta:     ?since=<version> -> เฉพาะ key ที่เปลี่ยนหลัง version นั้น (จาก guest_changes
+#               ที่ trigger ของ guests จดไว้) ถ้า log ไม่ครอบคลุมถึง since จะได้ snapshot เต็มแทน
+# 3) upload:    เช็คอินที่คิวไว้ตอน offline ส่งมาเป็น batch เดียว แต่ละรายการมี idempotency
+#               key ต่อ kiosk (ส่งซ้ำได้ผลเดิม ไม่ลง log ซ้ำ) — เขียนผ่าน CheckinLog.record_batch
+#
+# ทุกอย่างอ่านใน read transaction เดียว version จึงตรงกับข้อมูลที่ส่งไปเสมอ
+
+from datetime import datetime
+
+from guest_store import read_guest_version
+
+# token: kiosk ที่มีเครื่องสแกนหา QR -> แขกได้เองตอน offline เหมือนชื่อ
+FIELDS = ("key", "name", "seat", "seat_en", "token")
+SELECT_GUESTS = "SELECT name_key, display_name, seat, seat_en, checkin_token FROM guests"
+
+# เก็บ change log ไว้ไม่เกินเท่านี้แถว (kiosk ที่ตามหลังกว่านี้ได้ snapshot เต็ม)
+KEEP_CHANGES = 50000
+MAX_BATCH = 1000
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _row(r):
+    # display_name ว่าง (แถวที่ seed จาก CSV) = ใช้ key แสดงผล เหมือน GuestStore
+    return [r["name_key"], r["display_name"] or r["name_key"], r["seat"], r["seat_en"], r["checkin_token"]]
+
+
+def read_snapshot(conn):
+    """``{"version", "full": True, "fields", "guests": [[key, name, seat, seat_en, token], ...]}``"""
+    conn.execute("BEGIN")
+    try:
+        version = read_guest_version(conn)
+        guests = [_row(r) for r in conn.execute(SELECT_GUESTS + " ORDER BY name_key")]
+    finally:
+        conn.rollback()
+    return {"version": version, "full": True, "fields": FIELDS, "guests": guests}
+
+
+def read_changes(conn, since):
+    """
+    Guests changed after ``since``; ``None`` if the change log can't cover it.
+
+    คืน ``{"version", "full": False, "fields", "guests": [...], "deleted": [key, ...]}``
+    guests = สถานะปัจจุบันของ key ที่เปลี่ยน (เปลี่ยนกี่ครั้งก็ส่งครั้งเดียว)
+    """
+    conn.execute("BEGIN")
+    try:
+        version = read_guest_version(conn)
+        if since > version:
+            return None     # version จาก DB อื่น / ก่อนล้างข้อมูล
+        if since < version:
+            # prune_changes ตัดตาม id อาจเหลือแถวของ version เก่าสุดไม่ครบ (UPDATE จด 2 แถว
+            # ต่อ version: key เก่า + key ใหม่) จึงเชื่อได้เฉพาะ version ที่ใหม่กว่า oldest
+            oldest = conn.execute("SELECT MIN(version) FROM guest_changes").fetchone()[0]
+            if oldest is None or since < oldest:
+                return None
+        keys = {
+            r[0] for r in conn.execute(
+                "SELECT DISTINCT name_key FROM guest_changes WHERE version > ?", (since,)
+            )
+        }
+        guests = [
+            _row(r) for r in conn.execute(
+                SELECT_GUESTS + " WHERE name_key IN "
+                "(SELECT name_key FROM guest_changes WHERE version > ?) ORDER BY name_key",
+                (since,),
+            )
+        ]
+    finally:
+        conn.rollback()
+    deleted = sorted(keys - {g[0] for g in guests})
+    return {"version": version, "full": False, "fields": FIELDS, "guests": guests, "deleted": deleted}
+
+
+def prune_changes(conn, keep=KEEP_CHANGES):
+    """Drop all but the newest ``keep`` change-log rows; the caller commits."""
+    conn.execute(
+        "DELETE FROM guest_changes WHERE id <= (SELECT MAX(id) FROM guest_changes) - ?",
+        (keep,),
+    )
+
+
+def parse_offline_checkins(items, now):
+    """
+    Validate an upload batch.
+
+    แต่ละรายการ: ``{"id": idempotency key, "key"?: name_key ที่ kiosk หาเจอ,
+    "name"?: ชื่อที่พิมพ์, "at"?: "YYYY-MM-DD HH:MM:SS" เวลาไทยตอนเช็คอินจริง}``
+    คืน ``(entries, errors)`` — entries เป็น dict ที่ทำความสะอาดแล้ว
+    """
+    if not isinstance(items, list):
+        return [], [{"index": None, "error": "checkins must be a list"}]
+    if len(items) > MAX_BATCH:
+        return [], [{"index": None, "error": f"at most {MAX_BATCH} check-ins per batch"}]
+
+    entries, errors, seen = [], [], set()
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": i, "error": "each check-in must be an object"})
+            continue
+        idem = str(item.get("id") or "").strip()
+        key = str(item.get("key") or "").strip().lower()
+        name = str(item.get("name") or "").strip()
+        at = str(item.get("at") or "").strip().replace("T", " ")[:19]
+        if not idem or len(idem) > 128:
+            errors.append({"index": i, "error": "id (idempotency key) is required, max 128 chars"})
+            continue
+        if idem in seen:
+            errors.append({"index": i, "error": "duplicate id in batch"})
+            continue
+        if not key and not name:
+            errors.append({"index": i, "error": "key or name is required"})
+            continue
+        if at:
+            try:
+                datetime.strptime(at, TIME_FORMAT)
+            except ValueError:
+                errors.append({"index": i, "error": f"at must be {TIME_FORMAT}"})
+                continue
+        seen.add(idem)
+        entries.append({"id": idem, "key": key, "name": name, "at": at or now})
+    return entries, errors
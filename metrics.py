@@ -0,0 +1,257 @@
+# ============================================================
+# metrics.py — In-process counters/histograms in Prometheus text format
+# ============================================================
+#
+# เขียนเองแบบเล็ก ๆ (ไม่พึ่ง prometheus_client) ต้นทุนต่อครั้ง = lock + บวกเลข
+# - MetricsMiddleware: latency ต่อ route (template ไม่ใช่ path จริง) + คำขอที่ค้างอยู่
+# - TimedConnection: จับเวลาทุก statement ที่ผ่าน get_conn() (db.connect ใช้เป็น factory)
+# - timed(name): จับเวลาฟังก์ชันบนเส้นทางร้อน (lookup, record, save CSV ...)
+# - render(): ข้อความสำหรับ GET /metrics
+#
+# ค่าเป็นของ process นี้เท่านั้น (หลาย worker = scrape แยกกัน)
+
+import functools
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+
+# วินาที: ครอบตั้งแต่ statement SQLite สั้น ๆ ถึงคำขอที่ค้างนาน
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_, labelnames=()):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_, labelnames=()):
+        super().__init__(name, help_, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in items
+        ]
+
+
+class Gauge(_Metric):
+    """Set/inc/dec gauge, or ``collect`` = callable returning ``{labels: value}`` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help_, labelnames=(), collect=None):
+        super().__init__(name, help_, labelnames)
+        self._values = {}
+        self._collect = collect
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self):
+        if self._collect is not None:
+            items = sorted(self._collect().items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}       # labels -> [count ต่อ bucket (+Inf ท้าย), sum]
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self._series.items())
+        lines = self._header()
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                le = bound if bound == "+Inf" else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+registry = []
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------------
+# Metrics ของ app
+# -----------------------------
+HTTP_LATENCY = Histogram(
+    "checkin_http_request_duration_seconds", "HTTP request latency by route template.",
+    ("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "checkin_http_requests_in_flight", "Requests currently being handled (including open streams).",
+)
+SQL_LATENCY = Histogram(
+    "checkin_sqlite_statement_duration_seconds",
+    "SQLite execute/commit time through get_conn() (excludes row fetching).", ("statement",),
+)
+FUNCTION_LATENCY = Histogram(
+    "checkin_function_duration_seconds", "Time spent in instrumented hot-path functions.", ("function",),
+)
+CHECKINS = Counter(
+    "checkin_attempts_total", "Check-in attempts by result (hit, duplicate, ambiguous, not_found).", ("result",),
+)
+
+
+# -----------------------------
+# HTTP middleware (ASGI ตรง ๆ: ไม่บัฟเฟอร์ body จึงใช้กับ SSE/StreamingResponse ได้)
+# -----------------------------
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        # route ยังไม่รู้จนกว่า router จะจับคู่ จึงนับ in-flight รวม (ดูคิว DB แยกได้จาก lane)
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            HTTP_LATENCY.observe(time.perf_counter() - start, scope["method"], _route_of(scope), str(status))
+
+
+def _route_of(scope):
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+# -----------------------------
+# SQLite statement timing
+# -----------------------------
+_VERB = re.compile(r"^\s*(\w+)")
+_NOISE = re.compile(r"\bIF\s+NOT\s+EXISTS\b|\bOR\s+(?:REPLACE|IGNORE|ABORT|FAIL|ROLLBACK)\b", re.IGNORECASE)
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|INDEX|TRIGGER)\s+(\w+)", re.IGNORECASE)
+_statement_labels = {}
+
+
+def statement_label(sql):
+    """Low-cardinality label like ``SELECT guests`` for a SQL string (cached)."""
+    label = _statement_labels.get(sql)
+    if label is None:
+        verb = _VERB.match(sql)
+        table = _TABLE.search(_NOISE.sub("", sql))
+        label = " ".join(filter(None, [
+            verb.group(1).upper() if verb else "?",
+            table.group(1) if table else None,
+        ]))
+        if len(_statement_labels) < 1024:
+            _statement_labels[sql] = label
+    return label
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection that records execute/executemany/commit time."""
+
+    def execute(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            SQL_LATENCY.observe(time.perf_counter() - start, statement_label(sql))
+
+    def executemany(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            SQL_LATENCY.observe(time.perf_counter() - start, statement_label(sql))
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            SQL_LATENCY.observe(time.perf_counter() - start, "COMMIT")
+
+
+# -----------------------------
+# Function timing
+# -----------------------------
+def timed(name):
+    """Decorator: record ``fn``'s wall time under ``function=name``."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                FUNCTION_LATENCY.observe(time.perf_counter() - start, name)
+        return wrapper
+    return decorator
@@ -0,0 +1,277 @@
+# ============================================================
+# name_index.py — Partial-name matching for check-in lookups
+# ============================================================
+#
+# แทนการวนหา `name_key in gk` ทีละคน ด้วย trigram index
+# - normalize ชื่อแบบเข้าใจภาษาไทย: ตัดคำนำหน้า/ยศ (ส.ต.อ., นาย, นางสาว ...),
+#   ตัดวรรณยุกต์และสระบน/ล่าง, ไม่สนช่องว่าง
+# - ผลลัพธ์เรียงตามความใกล้เคียง (ตรงทั้งชื่อ > ขึ้นต้น > ต้นคำ > มีอยู่ในชื่อ)
+#   ให้ checkin() ตัดสินได้ว่าผลชัดเจนหรือควรให้ผู้ใช้เลือก
+
+import heapq
+import itertools
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+GRAM = 3
+# กลุ่มผลลัพธ์ (ขึ้นต้นชื่อ / ต้นคำ / กลางคำ) ที่ใหญ่กว่านี้ไม่จัดอันดับทีละชื่อ ถือว่ากำกวม
+# เช่น "ton", "son" อยู่กลางนามสกุลหลายพันคน, "สมชาย" เป็นชื่อต้นของหลายร้อยคน
+MAX_RANK = 200
+
+# วรรณยุกต์ ไม้ไต่คู้ การันต์ และสระบน/ล่าง (combining marks ของอักษรไทย)
+_THAI_MARKS = re.compile("[\u0e31\u0e34-\u0e3a\u0e47-\u0e4e]")
+
+# คำนำหน้า/ยศย่อ เช่น "ส.ต.อ.", "พ.ต.ท.หญิง", "นางสาว", "Mr."
+# คำนำหน้าแบบคำ (นาย, คุณ ...) ตัดเฉพาะเมื่อตามด้วยช่องว่าง หรือพยัญชนะ/สระหน้า ที่ขึ้นพยางค์ใหม่ได้
+# ("นายสมชาย" ตัด, "คุณากร" / "นายิกา" ไม่ตัด เพราะ "ากร" / "ิกา" ไม่ใช่ต้นชื่อ)
+_TITLE = re.compile(
+    r"^(?:"
+    r"(?:[\u0e01-\u0e2e]{1,3}\.)+(?:หญิง)?"
+    r"|(?:นางสาว|นาง|นาย|คุณ)(?=\s|[\u0e01-\u0e2e\u0e40-\u0e44])"
+    r"|(?:mrs|mr|ms|miss|dr)(?:\.|\s)"
+    r")\s*"
+)
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_name(s: str) -> str:
+    """Lower-case, titles stripped, Thai marks removed, single spaces."""
+    s = unicodedata.normalize("NFC", s or "").casefold().strip()
+    while True:
+        stripped = _TITLE.sub("", s, count=1)
+        if stripped == s:
+            break
+        s = stripped
+    s = _THAI_MARKS.sub("", s)
+    return _SPACE.sub(" ", s).strip()
+
+
+def _match_form(s: str):
+    """Normalized name without spaces + positions where each word starts."""
+    words = normalize_name(s).split(" ")
+    starts, pos = [], 0
+    for w in words:
+        starts.append(pos)
+        pos += len(w)
+    return "".join(words), frozenset(starts)
+
+
+def _grams(form: str):
+    return {form[i:i + GRAM] for i in range(len(form) - GRAM + 1)}
+
+
+def _start_grams(form: str, starts):
+    """Trigrams that begin a word (candidates for prefix / word-start matches)."""
+    return {form[i:i + GRAM] for i in starts if i + GRAM <= len(form)}
+
+
+def _union_upto(sets, exclude):
+    """Union of ``sets`` minus ``exclude``; stops early once it has more than MAX_RANK ids."""
+    out = set()
+    for ids in sets:
+        out.update(ids)
+        if len(out) > MAX_RANK + len(exclude):
+            break
+    return out - exclude
+
+
+def _rank(entry, q_form, q_raw):
+    """``(tier, raw_miss, length)`` of one index entry, or None if it doesn't contain the query."""
+    _, raw, form, starts = entry
+    pos = form.find(q_form)
+    if pos < 0:
+        return None
+    if raw == q_raw:
+        tier = 0
+    elif form == q_form:
+        tier = 1
+    elif pos == 0:
+        tier = 2
+    elif pos in starts:
+        tier = 3
+    else:
+        tier = 4
+    return (tier, 0 if q_raw in raw else 1, len(form))
+
+
+def is_short_query(query: str) -> bool:
+    """
+    True if the typed ``query`` has fewer than GRAM characters (spaces ignored).
+
+    นับจากที่พิมพ์จริง ไม่ใช่หลังตัดวรรณยุกต์/สระ: "ชัย" = 3 ตัวอักษร แม้ normalize แล้วเหลือ "ชย"
+    """
+    return len(_SPACE.sub("", (query or "").strip())) < GRAM
+
+
+class NameIndex:
+    """
+    Trigram index over guest ``name_key`` values.
+
+    search() คืน key ที่เรียงลำดับแล้ว คำค้นที่ normalize แล้วเหลือ 2 ตัวอักษร (เช่น "ชัย" -> "ชย")
+    หาจาก trigram ที่ขึ้นต้นด้วย 2 ตัวนั้น (_pairs) + ชื่อที่ลงท้ายด้วย 2 ตัวนั้น (_tails)
+    เหลือตัวเดียวหาเฉพาะชื่อที่ตรงทั้งชื่อ ไม่ scan ทุกคน
+
+    ไม่จัดอันดับ candidate ทั้งหมดของ trigram ที่พบบ่อย: ตรงทั้งชื่อตอบทันที จากนั้นไล่ทีละกลุ่ม
+    ขึ้นต้นชื่อ -> ต้นคำ -> กลางคำ (แยกด้วย postings ของ trigram ที่ต้นชื่อ/ต้นคำ) กลุ่มที่เกิน
+    MAX_RANK ชื่อหยิบมาแค่บางส่วนแบบกำกวม แล้วไม่ดูกลุ่มที่แย่กว่า
+    """
+
+    def __init__(self, keys=()):
+        self._lock = threading.Lock()
+        self._ids = {}                      # name_key -> id
+        self._entries = {}                  # id -> (name_key, raw, form, word_starts)
+        self._postings = defaultdict(set)   # trigram -> {id}
+        self._word_postings = defaultdict(set)  # trigram ที่ขึ้นต้นคำ -> {id}
+        self._prefix_postings = defaultdict(set)  # trigram แรกของชื่อ -> {id}
+        self._by_form = defaultdict(set)    # ชื่อหลัง normalize -> {id} (ตรงทั้งชื่อ)
+        self._pairs = defaultdict(set)      # 2 ตัวอักษรแรกของ trigram -> {trigram} (คำค้น 2 ตัว)
+        self._tails = defaultdict(set)      # 2 ตัวอักษรท้ายชื่อ -> {id}
+        self._next_id = 0
+        for k in keys:
+            self._add_locked(k)
+
+    def __len__(self):
+        return len(self._ids)
+
+    # -----------------------------
+    # Updates
+    # -----------------------------
+    def add(self, name_key: str):
+        with self._lock:
+            self._remove_locked(name_key)
+            self._add_locked(name_key)
+
+    def remove(self, name_key: str):
+        with self._lock:
+            self._remove_locked(name_key)
+
+    def _add_locked(self, name_key):
+        form, starts = _match_form(name_key)
+        if not form:
+            return
+        gid = self._next_id
+        self._next_id += 1
+        raw = _SPACE.sub(" ", name_key.casefold()).strip()
+        self._ids[name_key] = gid
+        self._entries[gid] = (name_key, raw, form, starts)
+        for g in _grams(form):
+            if g not in self._postings:
+                self._pairs[g[:2]].add(g)
+            self._postings[g].add(gid)
+        for g in _start_grams(form, starts):
+            self._word_postings[g].add(gid)
+        self._prefix_postings[form[:GRAM]].add(gid)
+        if len(form) >= 2:
+            self._tails[form[-2:]].add(gid)
+        self._by_form[form].add(gid)
+
+    def _remove_locked(self, name_key):
+        gid = self._ids.pop(name_key, None)
+        if gid is None:
+            return
+        _, _, form, starts = self._entries.pop(gid)
+        for g in _grams(form):
+            self._discard(self._postings, g, gid)
+            if g not in self._postings:
+                self._discard(self._pairs, g[:2], g)
+        for g in _start_grams(form, starts):
+            self._discard(self._word_postings, g, gid)
+        self._discard(self._prefix_postings, form[:GRAM], gid)
+        self._discard(self._tails, form[-2:], gid)
+        self._discard(self._by_form, form, gid)
+
+    @staticmethod
+    def _discard(postings, key, value):
+        ids = postings.get(key)
+        if ids is not None:
+            ids.discard(value)
+            if not ids:
+                del postings[key]
+
+    def _groups_locked(self, q_form):
+        """
+        ``[prefix, words, middle]`` id sets for a partial query, or None if nothing matches.
+
+        กลุ่มที่เกิน MAX_RANK อาจไม่ครบ (หยุดรวมเมื่อรู้แล้วว่าเกิน) ผู้เรียกใช้แค่บางส่วนอยู่แล้ว
+        """
+        if len(q_form) >= GRAM:
+            postings = [self._postings.get(g) for g in _grams(q_form)]
+            if not all(postings):
+                return None
+            postings.sort(key=len)
+            candidates = postings[0].intersection(*postings[1:])
+            first = q_form[:GRAM]
+            prefix = candidates & self._prefix_postings.get(first, set())
+            words = (candidates & self._word_postings.get(first, set())) - prefix
+            return [prefix, words, candidates - prefix - words]
+
+        # 2 ตัวอักษร: ทุก trigram ที่ขึ้นต้นด้วยคู่นี้ + ชื่อที่คู่นี้อยู่ท้ายสุด (มีคู่นี้อยู่แน่นอน)
+        first = self._pairs.get(q_form, ())
+        prefix = _union_upto((self._prefix_postings.get(g, ()) for g in first), set())
+        words = _union_upto((self._word_postings.get(g, ()) for g in first), prefix)
+        middle = _union_upto(
+            itertools.chain((self._postings[g] for g in first), [self._tails.get(q_form, ())]),
+            prefix | words,
+        )
+        if not (prefix or words or middle):
+            return None
+        return [prefix, words, middle]
+
+    # -----------------------------
+    # Lookup
+    # -----------------------------
+    def search(self, query: str, limit: int = 10):
+        """
+        Ranked matches as ``[(rank, name_key), ...]`` (best first).
+
+        rank = (tier, raw_miss, length) — tier 0 ชื่อตรงทุกตัวอักษร,
+        1 ตรงหลัง normalize, 2 ขึ้นต้นชื่อ, 3 ขึ้นต้นคำใดคำหนึ่ง, 4 อยู่กลางชื่อ;
+        raw_miss = 0 ถ้าคำค้นแบบยังไม่ normalize ก็อยู่ในชื่อด้วย
+        """
+        q_form, _ = _match_form(query)
+        if not q_form:
+            return []
+        q_raw = _SPACE.sub(" ", (query or "").casefold()).strip()
+
+        # ใต้ lock แค่หา candidate (postings เปลี่ยนได้จาก add/remove) จัดอันดับข้างนอก
+        groups, loose = [], []
+        with self._lock:
+            exact = self._by_form.get(q_form)
+            if exact or len(q_form) < 2 or is_short_query(query):
+                # ตรงทั้งชื่อ (tier 0/1) ชนะทุกแบบอยู่แล้ว ไม่ต้องดูชื่อที่แค่มีคำค้นอยู่ข้างใน
+                groups.append([self._entries[gid] for gid in exact or ()])
+            else:
+                found = self._groups_locked(q_form)
+                if found is None:
+                    return []
+                for group in found:
+                    if len(group) > MAX_RANK:
+                        entries = (self._entries[gid] for gid in group)
+                        loose = list(itertools.islice((e for e in entries if q_form in e[2]), limit))
+                        break
+                    groups.append([self._entries[gid] for gid in group])
+
+        ranked = []
+        for group in groups:
+            ranked += [(rank, e[0]) for e in group if (rank := _rank(e, q_form, q_raw))]
+            if len(ranked) >= limit:
+                break       # กลุ่มถัดไปแย่กว่าทุกตัวในกลุ่มนี้
+        else:
+            # กลุ่มใหญ่เกิน MAX_RANK: ไม่ดู raw_miss ให้เป็น 1 ทุกตัว (best_match ถือว่ากำกวม)
+            ranked += [((rank[0], 1, rank[2]), e[0]) for e in loose if (rank := _rank(e, q_form, q_raw))]
+        return heapq.nsmallest(limit, ranked)
+
+
+def best_match(ranked):
+    """
+    Pick the unambiguous winner from search() results, or ``None``.
+
+    ชนะชัดเจนเมื่อมีผลเดียว หรืออันดับแรกดีกว่าอันดับสอง (เทียบ tier และ raw_miss)
+    """
+    if not ranked:
+        return None
+    if len(ranked) == 1 or ranked[0][0][:2] < ranked[1][0][:2]:
+        return ranked[0][1]
+    return None
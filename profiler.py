@@ -0,0 +1,104 @@
+# ============================================================
+# profiler.py — Opt-in sampling profiler (admin toggles at runtime)
+# ============================================================
+#
+# ปิดไว้เป็นค่าเริ่มต้น (ไม่มีต้นทุนเลย) admin เปิดผ่าน /api/admin/profiler
+# เปิดแล้ว thread หนึ่งอ่าน stack ของทุก thread ทุก `interval` วินาที
+# (sys._current_frames) นับเป็น stack แบบ folded "a;b;c" -> เอาไปทำ flamegraph ได้
+# หยุดเองเมื่อครบ `duration` กันลืมเปิดค้างไว้ระหว่างงาน
+# thread ที่แค่รอ (queue/selector/lock) ไม่นับ จะได้เห็นเฉพาะงานจริง
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_DURATION = 600.0
+# (ไฟล์, ฟังก์ชัน) ปลายสุดของ stack ที่ถือว่า thread กำลังว่าง
+_IDLE = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("base_events.py", "_run_once"),
+}
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stacks = Counter()
+        self.samples = 0
+        self.interval = 0.0
+        self.started_at = None
+        self.stopped_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=0.005, duration=60.0):
+        """Start sampling (clears the previous profile)."""
+        self.stop()
+        with self._lock:
+            self._stacks = Counter()
+            self.samples = 0
+        self.interval = max(0.001, interval)
+        self.started_at = time.time()
+        self.stopped_at = None
+        self._stop.clear()
+        deadline = time.monotonic() + min(duration, MAX_DURATION)
+        self._thread = threading.Thread(
+            target=self._run, args=(deadline,), name="sampling-profiler", daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self, deadline):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            sampled = []
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+                if leaf in _IDLE:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                sampled.append(";".join(reversed(stack)))
+            with self._lock:
+                self.samples += 1
+                self._stacks.update(sampled)
+        self.stopped_at = time.time()
+
+    def report(self, limit=50):
+        with self._lock:
+            top = self._stacks.most_common(limit)
+            samples = self.samples
+        return {
+            "running": self.running,
+            "interval_ms": round(self.interval * 1000, 3),
+            "samples": samples,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "top": [{"stack": stack, "count": n} for stack, n in top],
+        }
+
+    def folded(self):
+        """All stacks in folded format (``stack count`` per line) for flamegraph tools."""
+        with self._lock:
+            items = sorted(self._stacks.items())
+        return "".join(f"{stack} {n}\n" for stack, n in items)
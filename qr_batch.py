@@ -0,0 +1,89 @@
+# ============================================================
+# qr_batch.py — Render every guest's check-in QR code (batch job)
+# ============================================================
+#
+# ใช้ก่อนงาน: สร้าง token ให้แขกที่ยังไม่มี แล้วเขียน QR เป็น SVG ต่อคน
+# + หน้า index.html รวมทุกใบไว้สั่งพิมพ์ (เรียงตามที่นั่ง)
+# QR = URL หน้าแรก ?t=<token> สแกนด้วยกล้องมือถือแล้วเช็คอินทันที (POST /checkin/token/...)
+#
+#   python qr_batch.py --base-url https://checkin.example.com
+#   python qr_batch.py --base-url ... --out qr/ --seat A1 --seat A2
+#
+# ต้องใช้ segno (ไม่อยู่ใน requirements.txt ของ server): pip install -r requirements-dev.txt
+# DB ตาม CHECKIN_DATA_DIR / CHECKIN_DB เหมือน app
+
+import argparse
+import html
+import sys
+from pathlib import Path
+from urllib.parse import quote
+
+try:
+    import segno
+except ImportError:     # optional: ใช้เฉพาะ job นี้
+    segno = None
+
+from db import DATA_DIR, get_conn, init_db
+
+
+def checkin_url(base_url, token):
+    return f"{base_url.rstrip('/')}/?t={quote(token)}"
+
+
+def load_guests(seats=None):
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT name_key, COALESCE(display_name, name_key) AS name, seat, seat_en, checkin_token "
+            "FROM guests ORDER BY seat, name"
+        ).fetchall()
+    if seats:
+        rows = [r for r in rows if r["seat"] in seats]
+    return rows
+
+
+def render(rows, base_url, out_dir, scale=4):
+    """Write ``<seat>-<token prefix>.svg`` per guest and a printable index.html; returns the count."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cards = []
+    for r in rows:
+        qr = segno.make(checkin_url(base_url, r["checkin_token"]), error="m")
+        # ชื่อไฟล์จาก token (ไม่ใช้ชื่อแขก: ภาษาไทย/อักขระพิเศษบนระบบไฟล์ต่าง ๆ)
+        filename = f"{r['seat'] or 'none'}-{r['checkin_token'][:8]}.svg"
+        qr.save(out_dir / filename, kind="svg", scale=scale, border=2)
+        cards.append(
+            f'<figure><img src="{quote(filename)}" alt="">'
+            f"<figcaption><b>{html.escape(r['name'])}</b><br>"
+            f"{html.escape(r['seat'] or '')} · {html.escape(r['seat_en'] or '')}</figcaption></figure>"
+        )
+
+    (out_dir / "index.html").write_text(
+        "<!doctype html><meta charset=\"utf-8\"><title>Check-in QR codes</title>\n"
+        "<style>body{font-family:sans-serif;display:flex;flex-wrap:wrap;gap:12px}"
+        "figure{width:180px;margin:0;text-align:center;break-inside:avoid}"
+        "img{width:160px;height:160px}</style>\n"
+        + "\n".join(cards) + "\n",
+        encoding="utf-8",
+    )
+    return len(cards)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Render check-in QR codes for all guests")
+    p.add_argument("--base-url", required=True, help="public URL of the check-in page")
+    p.add_argument("--out", default=str(DATA_DIR / "qr"), help="output directory")
+    p.add_argument("--seat", action="append", help="only these seats (repeatable)")
+    p.add_argument("--scale", type=int, default=4, help="pixels per QR module")
+    args = p.parse_args(argv)
+
+    if segno is None:
+        sys.exit("qr_batch.py needs segno: pip install -r requirements-dev.txt")
+
+    # สร้าง schema/token ที่ขาด (ทำใต้ file lock เดียวกับ app จึงรันขณะ server เปิดอยู่ได้)
+    init_db()
+    rows = load_guests({s.strip().upper() for s in args.seat} if args.seat else None)
+    n = render(rows, args.base_url, Path(args.out), args.scale)
+    print(f"wrote {n} QR codes to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# ============================================================
+# seat_map.py — Seat index and per-table fragments of seating-map.svg
+# ============================================================
+#
+# หน้าเช็คอินเดิมต้องโหลด+parse แผนผังเต็ม (1.6 MB) เพื่อไฮไลต์ที่นั่งเดียว
+# ที่นี่ parse SVG ครั้งเดียวตอน startup:
+# - seats: รหัสที่นั่ง (ตาม SEAT_PATTERN) -> bounding box ของ <g id="A1">
+# - fragment(seat): SVG เล็ก ๆ ที่ครอปรอบโต๊ะของที่นั่งนั้น (ทุกที่นั่งตัวอักษรเดียวกัน)
+#   มีเฉพาะ element ที่อยู่ในกรอบ, ตัด filter (เงา) ออก, คง id เดิมไว้
+#   -> applyHighlightInDoc ใน script.js ใช้ได้เหมือนแผนผังเต็ม
+#
+# bbox เป็นค่าประมาณ (path รวมจุดควบคุมของเส้นโค้ง) ใช้แค่ตัดสินว่าอยู่ในกรอบ
+
+import re
+import xml.etree.ElementTree as ET
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+ET.register_namespace("", SVG_NS)
+ET.register_namespace("xlink", XLINK_NS)
+
+PADDING = 40
+
+_NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_PATH_TOKEN = re.compile(rf"[MmLlHhVvCcSsQqTtAaZz]|{_NUMBER}")
+_TRANSLATE = re.compile(rf"^\s*translate\(\s*({_NUMBER})(?:[\s,]+({_NUMBER}))?\s*\)\s*$")
+_REF = re.compile(r"url\(#([^)]+)\)|^#(.+)$")
+# จำนวนตัวเลขต่อหนึ่งชุดของแต่ละคำสั่ง path
+_PATH_ARITY = {"M": 2, "L": 2, "T": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "A": 7, "Z": 0}
+
+
+def _tag(el):
+    return el.tag.rpartition("}")[2]
+
+
+def _num(el, name, default=0.0):
+    try:
+        return float(el.get(name, default))
+    except ValueError:
+        return default
+
+
+def _union(boxes):
+    boxes = [b for b in boxes if b is not None]
+    if not boxes:
+        return None
+    x0 = min(b[0] for b in boxes)
+    y0 = min(b[1] for b in boxes)
+    x1 = max(b[0] + b[2] for b in boxes)
+    y1 = max(b[1] + b[3] for b in boxes)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def _path_bbox(d):
+    xs, ys = [], []
+    x = y = start_x = start_y = 0.0
+    cmd = None
+    args = []
+    for tok in _PATH_TOKEN.findall(d or ""):
+        if tok.isalpha():
+            cmd, args = tok, []
+            if cmd in "Zz":
+                x, y = start_x, start_y
+            continue
+        if cmd is None:
+            return None
+        args.append(float(tok))
+        upper = cmd.upper()
+        if len(args) < _PATH_ARITY[upper]:
+            continue
+        rel = cmd.islower()
+        if upper == "H":
+            x = args[0] + (x if rel else 0)
+        elif upper == "V":
+            y = args[0] + (y if rel else 0)
+        else:
+            pts = args[5:] if upper == "A" else args
+            for i in range(0, len(pts), 2):
+                px = pts[i] + (x if rel else 0)
+                py = pts[i + 1] + (y if rel else 0)
+                xs.append(px)
+                ys.append(py)
+            x, y = xs[-1], ys[-1]
+        xs.append(x)
+        ys.append(y)
+        if upper == "M":
+            start_x, start_y = x, y
+            cmd = "l" if rel else "L"     # ตัวเลขชุดต่อไปหลัง M คือ lineto
+        args = []
+    if not xs:
+        return None
+    return (min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+
+
+def bbox(el):
+    """Approximate ``(x, y, w, h)`` of an element, or None if unknown."""
+    tag = _tag(el)
+    if tag == "rect":
+        box = (_num(el, "x"), _num(el, "y"), _num(el, "width"), _num(el, "height"))
+    elif tag in ("ellipse", "circle"):
+        rx = _num(el, "rx", _num(el, "r"))
+        ry = _num(el, "ry", _num(el, "r"))
+        box = (_num(el, "cx") - rx, _num(el, "cy") - ry, 2 * rx, 2 * ry)
+    elif tag == "path":
+        box = _path_bbox(el.get("d"))
+    elif tag == "g":
+        box = _union(bbox(c) for c in el)
+    else:
+        return None
+
+    transform = el.get("transform")
+    if box is not None and transform:
+        m = _TRANSLATE.match(transform)
+        if m is None:
+            return None                  # rotate/scale: ไม่คำนวณ
+        box = (box[0] + float(m.group(1)), box[1] + float(m.group(2) or 0), box[2], box[3])
+    return box
+
+
+def _intersects(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def _refs(el):
+    """ids referenced by url(#id) / href="#id" anywhere under ``el``."""
+    out = set()
+    for node in el.iter():
+        for value in node.attrib.values():
+            for m in _REF.finditer(value):
+                out.add(m.group(1) or m.group(2))
+    return out
+
+
+class SeatMap:
+    def __init__(self, svg_bytes, seat_pattern, padding=PADDING):
+        self.root = ET.fromstring(svg_bytes)
+        self.padding = padding
+        vb = [float(v) for v in self.root.get("viewBox", "0 0 0 0").replace(",", " ").split()]
+        self.view_box = tuple(vb) if len(vb) == 4 else (0.0, 0.0, _num(self.root, "width"), _num(self.root, "height"))
+
+        self.defs = {}
+        for defs in self.root.iter(f"{{{SVG_NS}}}defs"):
+            for d in defs:
+                if d.get("id"):
+                    self.defs[d.get("id")] = d
+
+        # element ที่วาดได้ (ข้าม <g> ห่อชั้นนอกที่มีแค่ filter) พร้อม bbox
+        self.shapes = []
+        self.seats = {}
+        for el in self._drawable(self.root):
+            box = bbox(el)
+            self.shapes.append((el, box))
+            seat_id = el.get("id") or ""
+            if box is not None and seat_pattern.match(seat_id):
+                self.seats[seat_id.upper()] = box
+
+    def _drawable(self, parent):
+        for el in parent:
+            tag = _tag(el)
+            if tag == "defs":
+                continue
+            # <g> ที่มี <g> ลูก = ชั้นห่อ (เช่น "Slide 16:9 - 1") -> ลงไปหาชิ้นข้างใน
+            # ที่นั่ง/ป้าย/โต๊ะ เป็น <g> ที่มีแต่ shape
+            if tag == "g" and any(_tag(c) == "g" for c in el):
+                yield from self._drawable(el)
+            else:
+                yield el
+
+    def table_box(self, seat_id):
+        """Crop window around every seat of ``seat_id``'s table, padded and clipped to the map."""
+        table = seat_id[0].upper()
+        box = _union(b for s, b in self.seats.items() if s[0] == table)
+        vx, vy, vw, vh = self.view_box
+        p = self.padding
+        x0 = max(vx, box[0] - p)
+        y0 = max(vy, box[1] - p)
+        x1 = min(vx + vw, box[0] + box[2] + p)
+        y1 = min(vy + vh, box[1] + box[3] + p)
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def fragment(self, seat_id):
+        """Small standalone SVG for ``seat_id``'s table (bytes)."""
+        window = self.table_box(seat_id)
+        svg = ET.Element(f"{{{SVG_NS}}}svg", {
+            "viewBox": " ".join(f"{v:g}" for v in window),
+            "width": f"{window[2]:g}",
+            "height": f"{window[3]:g}",
+            "fill": "none",
+        })
+        used = set()
+        for el, box in self.shapes:
+            if box is None or not _intersects(box, window):
+                continue
+            el = self._without_filters(el)
+            used |= _refs(el)
+            svg.append(el)
+
+        defs = ET.Element(f"{{{SVG_NS}}}defs")
+        pending, seen = list(used), set()
+        while pending:
+            ref = pending.pop()
+            if ref in seen or ref not in self.defs or _tag(self.defs[ref]) == "filter":
+                continue
+            seen.add(ref)
+            d = self.defs[ref]
+            defs.append(d)
+            pending.extend(_refs(d))
+        if len(defs):
+            svg.insert(0, defs)
+        return ET.tostring(svg, encoding="utf-8", xml_declaration=False)
+
+    @staticmethod
+    def _without_filters(el):
+        if not any("filter" in node.attrib for node in el.iter()):
+            return el
+        el = ET.fromstring(ET.tostring(el))
+        for node in el.iter():
+            node.attrib.pop("filter", None)
+        return el
@@ -0,0 +1,125 @@
+# ============================================================
+# snapshot.py — Debounced background writer for guests.csv
+# ============================================================
+#
+# admin แก้รายชื่อทีละหลายร้อยครั้ง ไม่ต้องเขียน guests.csv ใหม่ทุกครั้ง:
+# handler แค่เรียก mark_dirty() แล้ว thread เบื้องหลังเขียนครั้งเดียว
+# เมื่อเงียบไป `delay` วินาที (แต่ไม่เกิน `max_delay` นับจากการแก้ครั้งแรก)
+# ตัวเขียนจริง (save_guests_to_csv) เขียนไฟล์ชั่วคราวแล้ว rename ทับ
+# ไฟล์จึงไม่มีวันถูกตัดครึ่งแม้ process ตายกลางทาง
+
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+DELAY = int(os.getenv("GUESTS_CSV_DEBOUNCE_MS", "2000")) / 1000
+MAX_DELAY = int(os.getenv("GUESTS_CSV_MAX_DELAY_MS", "10000")) / 1000
+
+
+def write_atomic(path, write):
+    """Call ``write(f)`` on a temp file next to ``path``, fsync, then rename over it."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            result = write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return result
+
+
+class CsvSnapshotter:
+    """Coalesces guest edits into one call of ``save`` (see module comment)."""
+
+    def __init__(self, save, delay=DELAY, max_delay=MAX_DELAY):
+        self._save = save
+        self.delay = delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()     # save ทีละครั้ง (thread เบื้องหลัง vs flush)
+        self._dirty = False
+        self._first_change = 0.0
+        self._last_change = 0.0
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="guests-csv-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and write any pending edits."""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+        self._thread = None
+        if self._dirty:
+            self.flush()
+
+    def mark_dirty(self):
+        now = time.monotonic()
+        with self._cond:
+            if not self._dirty:
+                self._dirty = True
+                self._first_change = now
+            self._last_change = now
+            self._cond.notify()
+        if self._thread is None:
+            # ไม่มี thread (เช่นสคริปต์ที่ไม่ได้ startup app) -> เขียนทันทีแบบเดิม
+            self.flush()
+
+    @property
+    def pending(self):
+        return self._dirty
+
+    def flush(self):
+        """Write now, whether or not anything changed; returns ``save()``'s result."""
+        with self._write_lock:
+            with self._cond:
+                self._dirty = False
+            try:
+                return self._save()
+            except Exception:
+                with self._cond:
+                    self._mark_failed_locked()
+                raise
+
+    def _mark_failed_locked(self):
+        # เขียนไม่สำเร็จ: ถือว่ายังค้าง ลองใหม่รอบถัดไป
+        now = time.monotonic()
+        if not self._dirty:
+            self._dirty = True
+            self._first_change = now
+        self._last_change = now
+
+    def _run(self):
+        with self._cond:
+            while not self._stopping:
+                if not self._dirty:
+                    self._cond.wait()
+                    continue
+                due = min(self._last_change + self.delay, self._first_change + self.max_delay)
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                self._cond.release()
+                try:
+                    self.flush()
+                except Exception:
+                    log.exception("guests.csv snapshot failed; will retry")
+                finally:
+                    self._cond.acquire()
@@ -79,6 +79,21 @@ function applyHighlightInDoc(svgDoc, seatId){
     });
 }
 
+/* เปลี่ยนไฟล์ของ <object> โดยสร้างใหม่ (contentDocument เดิมไม่ค้าง ให้รอ load ได้ถูก) */
+function setMapSource(id, url){
+  const obj = document.getElementById(id);
+  if(!obj || !url || obj.getAttribute('data') === url) return;
+  const fresh = obj.cloneNode(false);
+  fresh.setAttribute('data', url);
+  obj.replaceWith(fresh);
+}
+
+/* แผนผังเต็ม (ใหญ่) โหลดเมื่อเปิด modal ครั้งแรกเท่านั้น */
+function loadFullMap(){
+  const obj = document.getElementById('seating-map-modal');
+  if(obj && !obj.getAttribute('data')) setMapSource('seating-map-modal', obj.dataset.src);
+}
+
 /* ให้มีไฮไลต์ได้ทีละที่เดียว */
 function highlightSeat(seatId){
   currentSeatId = seatId || null;
@@ -136,9 +151,18 @@ async function checkIn(){
   setBtnLoading(true);
   const formData = new FormData();
   formData.append('name', name);
+  await submitCheckin(fetch('/checkin', { method:'POST', body:formData }));
+}
+
+/* เปิดจาก QR (/?t=<token>): เช็คอินทันทีไม่ต้องพิมพ์ชื่อ */
+async function checkInToken(token){
+  setBtnLoading(true);
+  await submitCheckin(fetch('/checkin/token/' + encodeURIComponent(token), { method:'POST' }));
+}
 
+async function submitCheckin(request){
   try{
-  const res  = await fetch('/checkin', { method:'POST', body:formData });
+  const res  = await request;
   const data = await res.json();
 
   if(data.success){
@@ -148,6 +172,8 @@ async function checkIn(){
        <span style="color:#ffe957;font-size:0.97em;">Check-in successful! Your seat is<br><span style="color:#e32c2c">${data.seat_en || data.seat}</span></span>`,
       true
     );
+    // แผนผังย่อยรอบโต๊ะ (เล็กกว่าแผนผังเต็มมาก) แล้วไฮไลต์ที่นั่งในนั้น
+    setMapSource('seating-map', data.seat_map);
     highlightSeat(data.seat);
 
     // ถ้าเช็คอินซ้ำ => เปิด modal แจ้งเตือน
@@ -160,6 +186,9 @@ async function checkIn(){
         <div style="opacity:.9; font-size:1.6em;">You have already checked in.<br>Your seat is <b>${data.seat_en || data.seat}</b>.</div>
       `);
     }
+  }else if(data.ambiguous && data.candidates && data.candidates.length){
+    showCandidates(data.error, data.candidates);
+    highlightSeat(null);
   }else{
     showResult(data.error, false);
     highlightSeat(null);
@@ -180,6 +209,26 @@ function showResult(msg, success){
   addPulseEffect(resultDiv);
 }
 
+/* พบหลายชื่อ -> ให้เลือกชื่อเต็ม แล้วเช็คอินด้วยชื่อนั้น */
+function showCandidates(msg, candidates){
+  showResult(msg, false);
+  const resultDiv = document.getElementById('result');
+  const list = document.createElement('div');
+  list.className = 'candidate-list';
+  candidates.forEach(full => {
+    const b = document.createElement('button');
+    b.type = 'button';
+    b.className = 'candidate-btn';
+    b.textContent = full;
+    b.addEventListener('click', () => {
+      document.getElementById('name').value = full;
+      checkIn();
+    });
+    list.appendChild(b);
+  });
+  resultDiv.appendChild(list);
+}
+
 /* Enter -> checkin */
 document.addEventListener('DOMContentLoaded', () => {
   const btn   = document.getElementById('checkin-btn');
@@ -214,7 +263,7 @@ document.addEventListener('DOMContentLoaded', () => {
   const closeBtn = document.getElementById('closeMapModalBtn');
 
   if(openBtn && modal){
-    openBtn.onclick = () => { modal.classList.add('open'); syncHighlightToModal(); };
+    openBtn.onclick = () => { modal.classList.add('open'); loadFullMap(); syncHighlightToModal(); };
   }
   if(closeBtn && modal){
     closeBtn.onclick = () => modal.classList.remove('open');
@@ -279,8 +328,15 @@ document.addEventListener('DOMContentLoaded', () => {
 });
 
 
-  // แสดงทุกครั้งที่รีเฟรช
-  openWelcomeModal();
+  // แสดงทุกครั้งที่รีเฟรช (ยกเว้นเปิดจาก QR: เช็คอินให้เลย)
+  const token = new URLSearchParams(location.search).get('t');
+  if(token){
+    // เอา token ออกจาก URL: รีเฟรชแล้วจะไม่เช็คอินซ้ำ
+    history.replaceState(null, '', location.pathname);
+    checkInToken(token);
+  }else{
+    openWelcomeModal();
+  }
 });
 
 function openDupModal(msgHtml){
@@ -0,0 +1,221 @@
+# ============================================================
+# static_assets.py — Precompressed, cacheable static files and pages
+# ============================================================
+#
+# แทน StaticFiles/FileResponse เดิมที่ส่งไฟล์ดิบทุกครั้ง (แผนผัง SVG 1.6 MB)
+# ตอน startup สร้างทุกไฟล์ครั้งเดียวในหน่วยความจำ:
+# - SVG: ย่อช่องว่างระหว่าง tag และเปลี่ยนรูป data: URI ที่ซ้ำกับไฟล์ใน static/
+#   (โลโก้ PNG ที่ฝังไว้ทั้งไฟล์) เป็นลิงก์ไปยังไฟล์นั้น -> browser โหลดครั้งเดียว
+# - ไฟล์ text (svg/css/js/html) บีบอัด gzip และ brotli (ถ้าติดตั้ง `brotli`)
+#   ผลบีบอัดเก็บไว้ใน cache_dir ตาม hash ของเนื้อหา restart ครั้งถัดไปไม่ต้องบีบใหม่
+# - หน้า HTML: เติม ?v=<hash> ให้ลิงก์ static/... -> URL เปลี่ยนเมื่อเนื้อหาเปลี่ยน
+#
+# ตอบ: ETag ต่อ encoding, If-None-Match -> 304, Vary: Accept-Encoding
+# URL ที่มี ?v= ตรง hash ปัจจุบัน = immutable 1 ปี, อย่างอื่น = no-cache (ถาม ETag ทุกครั้ง)
+# ไฟล์ที่แก้หลัง startup จะเห็นหลัง restart
+
+import base64
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from urllib.parse import quote, unquote
+
+try:
+    import brotli
+except ImportError:     # optional: ไม่มีก็ส่งแค่ gzip
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE = {".svg", ".css", ".js", ".html", ".json", ".txt", ".csv"}
+MIN_COMPRESS_SIZE = 1024
+
+_DATA_URI = re.compile(rb'(href=")data:[\w/+.-]+;base64,([A-Za-z0-9+/=\s]+)(")')
+_TAG_GAP = re.compile(rb">\s*\n\s*<")
+_STATIC_REF = re.compile(r"""(?<=["'(])(/?static/)([^"'?#)]+)""")
+
+
+class Asset:
+    __slots__ = ("body", "media_type", "etag", "variants")
+
+    def __init__(self, body, media_type):
+        self.body = body
+        self.media_type = media_type
+        self.etag = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {}      # encoding -> bytes (เฉพาะที่เล็กกว่าต้นฉบับ)
+
+
+def _media_type(name):
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type in ("image/svg+xml", "application/javascript"):
+        media_type += "; charset=utf-8"
+    return media_type
+
+
+def parse_accept_encoding(header):
+    """``{coding: q}`` from an Accept-Encoding header."""
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+class AssetStore:
+    """Built once at startup; see module comment."""
+
+    def __init__(self, static_dir, pages_dir, cache_dir=None):
+        self.static_dir = static_dir
+        self.pages_dir = pages_dir
+        self.cache_dir = cache_dir
+        self.files = {}         # ชื่อไฟล์ใน static/ -> Asset
+        self.pages = {}         # ชื่อไฟล์ HTML -> Asset
+
+    # -----------------------------
+    # Build
+    # -----------------------------
+    def build(self, pages=()):
+        raw = {
+            p.name: p.read_bytes()
+            for p in sorted(self.static_dir.iterdir())
+            if p.is_file() and not p.name.startswith(".")
+        }
+        files = {}
+        # ไฟล์ที่ไม่ใช่ SVG ก่อน: SVG ต้องรู้ hash ของไฟล์ที่มันอ้างถึง
+        for name in sorted(raw, key=lambda n: n.endswith(".svg")):
+            body = raw[name]
+            if name.endswith(".svg"):
+                body = self._minify_svg(body, raw, files)
+            files[name] = self._finish(name, body)
+        self.files = files
+
+        page_assets = {}
+        for name in pages:
+            html = (self.pages_dir / name).read_text(encoding="utf-8")
+            page_assets[name] = self._finish(name, self._version_links(html).encode("utf-8"))
+        self.pages = page_assets
+
+        total = sum(len(b) for b in raw.values())
+        sent = sum(min([len(a.body), *map(len, a.variants.values())]) for a in files.values())
+        log.info("static assets: %d files, %d -> %d bytes (smallest encoding)", len(files), total, sent)
+
+    def add(self, name, body):
+        """Register a generated file (served as static/<name>)."""
+        self.files[name] = self._finish(name, body)
+
+    def url(self, name):
+        """Content-hashed URL path for a file in static/."""
+        return f"static/{quote(name)}?v={self.files[name].etag}"
+
+    def _minify_svg(self, body, raw, files):
+        by_content = {content: n for n, content in raw.items() if n in files}
+
+        def relink(m):
+            try:
+                data = base64.b64decode(m.group(2))
+            except ValueError:
+                return m.group(0)
+            name = by_content.get(data)
+            if name is None:
+                return m.group(0)
+            # href สัมพัทธ์กับตัว SVG ซึ่งอยู่ใน static/ เหมือนกัน
+            link = f"{quote(name)}?v={files[name].etag}".encode("ascii")
+            return m.group(1) + link + m.group(3)
+
+        body = _DATA_URI.sub(relink, body)
+        return _TAG_GAP.sub(b"><", body).strip()
+
+    def _version_links(self, html):
+        def versioned(m):
+            name = unquote(m.group(2))
+            asset = self.files.get(name)
+            if asset is None:
+                return m.group(0)
+            return f"{m.group(1)}{m.group(2)}?v={asset.etag}"
+        return _STATIC_REF.sub(versioned, html)
+
+    def _finish(self, name, body):
+        asset = Asset(body, _media_type(name))
+        if os.path.splitext(name)[1].lower() in COMPRESSIBLE and len(body) >= MIN_COMPRESS_SIZE:
+            for coding, compress in (("br", self._brotli), ("gzip", self._gzip)):
+                if coding == "br" and brotli is None:
+                    continue
+                data = self._cached(asset.etag, coding, lambda: compress(body))
+                if len(data) < len(body):
+                    asset.variants[coding] = data
+        return asset
+
+    @staticmethod
+    def _gzip(body):
+        return gzip.compress(body, compresslevel=9, mtime=0)
+
+    @staticmethod
+    def _brotli(body):
+        return brotli.compress(body, quality=11)
+
+    def _cached(self, etag, coding, compress):
+        if self.cache_dir is None:
+            return compress()
+        path = self.cache_dir / f"{etag}.{coding}"
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            pass
+        data = compress()
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError:
+            log.warning("could not cache %s", path, exc_info=True)
+        return data
+
+    # -----------------------------
+    # Serve
+    # -----------------------------
+    def respond(self, asset, headers, version=None, head=False):
+        """
+        Return ``(status, body, response_headers)`` for ``asset``.
+
+        headers = request headers (Accept-Encoding, If-None-Match)
+        """
+        accepted = parse_accept_encoding(headers.get("accept-encoding"))
+        coding = next(
+            (c for c in ("br", "gzip") if c in asset.variants and accepted.get(c, 0) > 0),
+            None,
+        )
+        etag = f'"{asset.etag}-{coding}"' if coding else f'"{asset.etag}"'
+        out = {
+            "ETag": etag,
+            "Vary": "Accept-Encoding",
+            "Cache-Control": IMMUTABLE if version == asset.etag else REVALIDATE,
+        }
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match:
+            # เนื้อหาเดียวกันทุก encoding: ถือ tag ของ encoding ไหนก็ได้ที่ hash ตรง
+            tags = {t.strip().removeprefix("W/").strip('"').split("-")[0] for t in if_none_match.split(",")}
+            if "*" in tags or asset.etag in tags:
+                return 304, b"", out
+
+        body = asset.variants[coding] if coding else asset.body
+        if coding:
+            out["Content-Encoding"] = coding
+        out["Content-Type"] = asset.media_type
+        out["Content-Length"] = str(len(body))
+        return 200, (b"" if head else body), out
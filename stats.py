@@ -0,0 +1,209 @@
+# ============================================================
+# stats.py — Attendance counters for /api/admin/stats
+# ============================================================
+#
+# นับไว้ในหน่วยความจำ อัปเดตทีละเหตุการณ์ endpoint จึงตอบได้ทันทีโดยไม่ต้อง scan checkins/guests
+# - check-in: แถว log ใหม่จาก ChangeFeed (ทุก worker ที่ใช้ไฟล์ DB เดียวกัน ไม่ใช่แค่ process นี้)
+# - รายชื่อ: guest CRUD handlers ส่ง guest_meta.version มาด้วย ถ้าไม่ต่อเนื่องกับที่เห็นล่าสุด
+#   (worker อื่นแก้ไปก่อน) ก็โหลดใหม่ทั้งหมดแทน
+# - expected/arrived ต่อที่นั่ง (arrived = แขกที่เช็คอินครั้งแรกแล้ว นับตามที่นั่งปัจจุบัน)
+# - จำนวนครั้งที่เช็คอินสำเร็จ / ซ้ำ / ไม่พบชื่อ
+# - histogram จำนวนแขกที่มาถึง (ครั้งแรก) ต่อนาที
+#
+# load() อ่านจาก DB ตอน startup (และหลัง import ทั้งไฟล์ / แก้จาก process อื่น)
+# โดยใช้ guest_checkins + index ของ checkins(seat) ไม่อ่าน log ทั้งตาราง
+
+import threading
+from collections import Counter
+
+from guest_store import LocalVersions, read_guest_version
+
+
+class AttendanceStats:
+    def __init__(self, get_conn):
+        self._get_conn = get_conn
+        self._lock = threading.Lock()
+        self._reset()
+        self.last_id = 0                # checkins.id ล่าสุดที่นับแล้ว
+        self.guest_version = None       # guest_meta.version ที่ตัวนับรายชื่อสะท้อนอยู่
+        self.local_versions = LocalVersions()   # commit เองใน process นี้ (ยังไม่ได้ apply)
+
+    def _reset(self):
+        self._seat_of = {}              # name_key -> seat ของแขกที่อยู่ในรายชื่อ
+        self._arrived_keys = set()      # name_key ที่เคยเช็คอิน (เหมือน guest_checkins)
+        self._expected = Counter()      # seat -> จำนวนแขก
+        self._arrived = Counter()       # seat -> จำนวนแขกที่มาแล้ว
+        self._arrived_total = 0
+        self._per_minute = Counter()    # "YYYY-MM-DD HH:MM" -> มาถึงครั้งแรก
+        self.checkins = 0
+        self.duplicates = 0
+        self.not_found = 0
+
+    def load(self):
+        with self._lock, self._get_conn() as conn:
+            # อ่านทุกอย่างใน read transaction เดียว: last_id ตรงกับตัวนับเป๊ะ
+            # แม้ worker อื่นเขียนแทรกระหว่างนี้
+            conn.execute("BEGIN")
+            try:
+                guests = conn.execute("SELECT name_key, seat FROM guests").fetchall()
+                arrivals = conn.execute(
+                    "SELECT name_key, first_checkin_at, checkin_count FROM guest_checkins"
+                ).fetchall()
+                not_found = conn.execute("SELECT COUNT(*) FROM checkins WHERE seat IS NULL").fetchone()[0]
+                last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM checkins").fetchone()[0]
+                version = read_guest_version(conn)
+            finally:
+                conn.rollback()
+
+            self._reset()
+            for r in guests:
+                self._add_guest_locked(r["name_key"], r["seat"])
+            for r in arrivals:
+                self._arrive_locked(r["name_key"], r["first_checkin_at"])
+                self.checkins += r["checkin_count"]
+                self.duplicates += r["checkin_count"] - 1
+            self.not_found = not_found
+            self.last_id = last_id
+            self.guest_version = version
+            self.local_versions.applied(version)
+
+    # -----------------------------
+    # Check-in events
+    # -----------------------------
+    def apply_checkins(self, rows):
+        """
+        Count new ``checkins`` rows (dicts from ChangeFeed, ordered by id).
+
+        แถวที่ id <= last_id นับไปแล้วตอน load() จึงข้าม
+        seat ว่าง = ไม่พบชื่อ, key ของแขกได้จากชื่อใน log เหมือนตอน migrate guest_checkins
+        """
+        with self._lock:
+            self._apply_checkins_locked(rows)
+
+    def _apply_checkins_locked(self, rows):
+        for r in rows:
+            if r["id"] <= self.last_id:
+                continue
+            self.last_id = r["id"]
+            if r["seat"] is None:
+                self.not_found += 1
+                continue
+            name_key = (r["name"] or "").strip().lower()
+            self.checkins += 1
+            if name_key in self._arrived_keys:
+                self.duplicates += 1
+            else:
+                self._arrive_locked(name_key, r["created_at"])
+
+    def _catch_up_locked(self, upto_id):
+        # อ่านแถวที่ยังไม่ได้นับเอง (feed ส่งมาทีหลังก็ข้ามเพราะ id <= last_id แล้ว)
+        if upto_id <= self.last_id:
+            return
+        with self._get_conn() as conn:
+            rows = conn.execute(
+                "SELECT id, name, seat, created_at FROM checkins WHERE id > ? AND id <= ? ORDER BY id",
+                (self.last_id, upto_id),
+            ).fetchall()
+        self._apply_checkins_locked(rows)
+
+    def _arrive_locked(self, name_key, created_at):
+        self._arrived_keys.add(name_key)
+        seat = self._seat_of.get(name_key)
+        if seat is not None:
+            self._arrived[seat] += 1
+            self._arrived_total += 1
+        if created_at:
+            self._per_minute[created_at[:16]] += 1
+
+    # -----------------------------
+    # Guest list events
+    # -----------------------------
+    # ``version`` = guest_meta.version ที่อ่านใน transaction เดียวกับการเขียน (เหมือน GuestStore)
+    def guest_added(self, name_key, seat, version):
+        with self._lock:
+            if self._advance_locked(version):
+                self._add_guest_locked(name_key, seat)
+                return
+        self.load()
+
+    def guest_updated(self, old_key, new_key, seat, version, last_log_id=None):
+        """
+        ``last_log_id`` = checkins.id ล่าสุดตอน rename commit: แถว log ก่อนหน้านั้นที่ feed
+        ยังส่งมาไม่ถึงยังเป็นชื่อเก่า ต้องนับให้ครบก่อนย้ายสถานะไปชื่อใหม่ (ไม่งั้นหาย/นับซ้ำ)
+        """
+        with self._lock:
+            if self._advance_locked(version):
+                if new_key != old_key and last_log_id is not None:
+                    self._catch_up_locked(last_log_id)
+                self._remove_guest_locked(old_key)
+                if new_key != old_key and old_key in self._arrived_keys:
+                    # สถานะเช็คอินย้ายตามชื่อใหม่ (UPDATE OR REPLACE guest_checkins)
+                    self._arrived_keys.discard(old_key)
+                    self._arrived_keys.add(new_key)
+                self._add_guest_locked(new_key, seat)
+                return
+        self.load()
+
+    def guest_deleted(self, name_key, version):
+        with self._lock:
+            if self._advance_locked(version):
+                self._remove_guest_locked(name_key)
+                return
+        self.load()
+
+    def _advance_locked(self, version):
+        # version เท่าเดิม = load() ไปแล้วหลัง commit นี้ (ทำซ้ำได้ไม่เสียหาย)
+        if self.guest_version not in (version, version - 1):
+            return False
+        self.guest_version = version
+        self.local_versions.applied(version)
+        return True
+
+    # -----------------------------
+    # Local vs. other-process edits (ดู on_guest_version ใน app.py)
+    # -----------------------------
+    # change feed มักเห็น commit ของ handler ใน process นี้ก่อนที่ handler จะเรียก
+    # guest_*() handler จึงจด version ไว้ใน local_versions ก่อน commit แล้ว feed ข้าม version เหล่านั้น
+    def is_known(self, version):
+        """True if every guests change up to ``version`` is applied here or was made by this process."""
+        with self._lock:
+            if self.guest_version is None:
+                return False
+            return self.local_versions.covers(self.guest_version, version)
+
+    def _add_guest_locked(self, name_key, seat):
+        self._remove_guest_locked(name_key)
+        self._seat_of[name_key] = seat
+        self._expected[seat] += 1
+        if name_key in self._arrived_keys:
+            self._arrived[seat] += 1
+            self._arrived_total += 1
+
+    def _remove_guest_locked(self, name_key):
+        seat = self._seat_of.pop(name_key, None)
+        if seat is None:
+            return
+        self._expected[seat] -= 1
+        if name_key in self._arrived_keys:
+            self._arrived[seat] -= 1
+            self._arrived_total -= 1
+
+    # -----------------------------
+    # Read
+    # -----------------------------
+    def snapshot(self):
+        with self._lock:
+            seats = {
+                seat: {"expected": self._expected[seat], "arrived": self._arrived[seat]}
+                for seat in sorted(self._expected.keys() | self._arrived.keys())
+                if self._expected[seat] or self._arrived[seat]
+            }
+            return {
+                "expected": len(self._seat_of),
+                "arrived": self._arrived_total,
+                "checkins": self.checkins,
+                "duplicates": self.duplicates,
+                "not_found": self.not_found,
+                "seats": seats,
+                "per_minute": sorted(self._per_minute.items()),
+            }